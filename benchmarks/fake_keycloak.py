@@ -0,0 +1,133 @@
+import re
+import json
+import time
+import uuid
+import threading
+import jwt
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+def encode(claims, key, algorithm, headers=None):
+    token = jwt.encode(claims, key, algorithm=algorithm, headers=headers)
+    return token if isinstance(token, str) else token.decode("utf-8")
+
+class FakeKeycloak:
+    def __init__(self, host="127.0.0.1", port=0, latency=0, token_lifetime=3600):
+        """
+            Local stand-in for the Keycloak endpoints used by rpi.keycloak.
+
+            Serves admin-cli token grants, realm signing keys, user lookup and user sessions. Member tokens are
+            RS256 signed so they pass local verification. latency seconds are added to every response to
+            emulate a remote Keycloak. calls counts requests per endpoint.
+        """
+        self.latency = latency
+        self.token_lifetime = token_lifetime
+        self.kid = "benchmark"
+        self.private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+        self.private_pem = self.private_key.private_bytes(encoding=serialization.Encoding.PEM,
+                                                          format=serialization.PrivateFormat.PKCS8,
+                                                          encryption_algorithm=serialization.NoEncryption())
+        self.users = {}
+        self.calls = Counter()
+
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-keycloak", daemon=True)
+
+    @property
+    def host(self):
+        return f"{self.server.server_address[0]}:{self.server.server_address[1]}"
+
+    @property
+    def issuer(self):
+        return f"http://{self.host}/auth/realms/pelbox"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def admin_tokens(self):
+        now = int(time.time())
+        access_token = encode({"sub": "admin-cli", "exp": now + self.token_lifetime, "iat": now}, "admin", "HS256")
+        refresh_token = encode({"sub": "admin-cli", "exp": now + 2 * self.token_lifetime, "iat": now}, "admin", "HS256")
+        return {"access_token": access_token, "refresh_token": refresh_token, "expires_in": self.token_lifetime}
+
+    def member_token(self, username):
+        """
+            Returns signed access token of the member, member is registered with the fake on first use.
+        """
+        sub = self.users.setdefault(username, str(uuid.uuid4()))
+        now = int(time.time())
+        claims = {
+            "sub": sub,
+            "jti": str(uuid.uuid4()),
+            "preferred_username": username,
+            "iss": self.issuer,
+            "aud": "account",
+            "azp": "pelbox-users",
+            "iat": now,
+            "exp": now + self.token_lifetime
+        }
+        return encode(claims, self.private_pem, "RS256", headers={"kid": self.kid})
+
+    def jwks(self):
+        jwk = json.loads(RSAAlgorithm.to_jwk(self.private_key.public_key()))
+        jwk.update({"kid": self.kid, "use": "sig", "alg": "RS256"})
+        return {"keys": [jwk]}
+
+    def handler(self):
+        keycloak = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def respond(self, status, body):
+                if keycloak.latency:
+                    time.sleep(keycloak.latency)
+                data = b"" if body is None else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                path = urlparse(self.path).path
+                keycloak.calls[f"POST {path}"] += 1
+
+                if path == "/auth/realms/master/protocol/openid-connect/token":
+                    return self.respond(200, keycloak.admin_tokens())
+                if path == "/auth/realms/pelbox/protocol/openid-connect/logout":
+                    return self.respond(204, None)
+                return self.respond(404, {"error": "not_found"})
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                sessions = re.fullmatch(r"/auth/admin/realms/pelbox/users/([^/]+)/sessions", url.path)
+                keycloak.calls["GET sessions" if sessions else f"GET {url.path}"] += 1
+
+                if url.path == "/auth/realms/pelbox/protocol/openid-connect/certs":
+                    return self.respond(200, keycloak.jwks())
+                if sessions:
+                    logged_in = sessions.group(1) in keycloak.users.values()
+                    return self.respond(200, [{"id": str(uuid.uuid4())}] if logged_in else [])
+                if url.path == "/auth/admin/realms/pelbox/users":
+                    username = parse_qs(url.query).get("username", [""])[0]
+                    return self.respond(200, [{"id": keycloak.users[username]}] if username in keycloak.users else [])
+                return self.respond(404, {"error": "not_found"})
+
+        return Handler
@@ -0,0 +1,187 @@
+"""
+    Micro-benchmark of building Member and PelBox models from database rows.
+
+    Compares the JSON round trip models used before (dict, json.dumps, encode, json.loads) with from_row on the
+    slotted models, measuring CPU time, peak and kept memory per build and instance size.
+    Meant to be run on the Pi itself, results on a desktop CPU say little about ARM. Needs Python 3.9 or newer
+    for tracemalloc.reset_peak.
+
+    Usage:
+        python -m benchmarks.models --iterations 20000 --output models.json
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+from rpi.member import Member
+from rpi.pelbox_member import PelBox
+
+MEMBER_ROW = (42, "bench-user", "bench-user@benchmark.local", "Bench", "User", "F", "Croatia", "Zagreb", "Ilica 1", "10000",
+              "+385000000", "phone-token", "PelBox d.o.o.", 7, "info@pelbox.local")
+PELBOX_ROW = (3, "security-key", "user-security-key", "127.0.0.1", 42, True, False, False, 2, False)
+
+class LegacyMember:
+    """
+        Member as built before from_row, kept here only as a baseline.
+    """
+    def __init__(self, data):
+        data_json = json.loads(data.decode("utf-8"))
+
+        self.id = None
+        self.username = data_json["username"]
+        self.email = data_json["email"]
+        self.password = data_json["password"]
+        self.phone_token = data_json["phone_token"]
+
+        self.access_token = None
+        self.refresh_token = None
+        self.first_name = None
+        self.last_name = None
+        self.gender = None
+        self.country = None
+        self.city = None
+        self.city_address = None
+        self.postal_code = None
+        self.phone_number = None
+        self.organization_name = None
+        self.organization_id = None
+        self.organization_email = None
+
+    @staticmethod
+    def new(id, username, email, first_name, last_name, gender, country, city, city_address, postal_code, phone_number, phone_token, organization_name, organization_id, organization_email):
+        new_data = {
+            "id": id, "username": username, "email": email, "password": "", "first_name": first_name,
+            "last_name": last_name, "gender": gender, "country": country, "city": city, "city_address": city_address,
+            "postal_code": postal_code, "phone_number": phone_number, "phone_token": phone_token,
+            "organization_name": organization_name, "organization_id": organization_id, "organization_email": organization_email
+        }
+
+        member = LegacyMember(json.dumps(new_data).encode("utf-8"))
+        member.id = new_data["id"]
+        member.first_name = new_data["first_name"]
+        member.last_name = new_data["last_name"]
+        member.gender = new_data["gender"]
+        member.country = new_data["country"]
+        member.city = new_data["city"]
+        member.city_address = new_data["city_address"]
+        member.postal_code = new_data["postal_code"]
+        member.phone_number = new_data["phone_number"]
+        member.phone_token = new_data["phone_token"]
+        member.organization_name = new_data["organization_name"]
+        member.organization_id = new_data["organization_id"]
+        member.organization_email = new_data["organization_email"]
+        return member
+
+class LegacyPelBox:
+    """
+        PelBox as built before from_row, kept here only as a baseline.
+    """
+    def __init__(self, data):
+        data_json = json.loads(data.decode("utf-8"))
+
+        self.id = data_json["id"]
+        self.security_key = data_json["security_key"]
+        self.user_security_key = data_json["user_security_key"]
+        self.member_id = data_json["member_id"]
+        self.host = data_json["host"]
+        self.connected = data_json["connected"]
+        self.locked = data_json["locked"]
+        self.dismantle = data_json["dismantle"]
+        self.expanding_value = data_json["expanding_value"]
+        self.door_open = data_json["door_open"]
+
+    @staticmethod
+    def new(id, security_key, user_security_key, host, member_id, connected, locked, dismantle, expanding_value, door_open):
+        new_data = {
+            "id": id, "security_key": security_key, "user_security_key": user_security_key, "member_id": member_id,
+            "host": host, "connected": connected, "locked": locked, "dismantle": dismantle,
+            "expanding_value": expanding_value, "door_open": door_open
+        }
+        return LegacyPelBox(json.dumps(new_data).encode("utf-8"))
+
+CASES = {
+    "member_legacy": lambda: LegacyMember.new(*MEMBER_ROW),
+    "member_from_row": lambda: Member.from_row(MEMBER_ROW),
+    "pelbox_legacy": lambda: LegacyPelBox.new(*PELBOX_ROW),
+    "pelbox_from_row": lambda: PelBox.from_row(PELBOX_ROW),
+    "pelbox_json_data": lambda: PelBox.from_row(PELBOX_ROW).json_data()
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark Member and PelBox model construction")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5, help="timing runs per case, the fastest is reported")
+    parser.add_argument("--output", help="JSON file to write results to")
+    return parser.parse_args()
+
+def cpu_per_call(build, iterations, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.process_time()
+        for _ in range(iterations):
+            build()
+        elapsed = time.process_time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / iterations
+
+def memory_per_call(build, iterations):
+    """
+        Returns (peak bytes, kept bytes) per call. Peak counts temporary objects like the JSON string too,
+        kept is what stays allocated for the built model.
+    """
+    tracemalloc.start()
+
+    peaks = 0
+    for _ in range(iterations):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        build()
+        peaks += tracemalloc.get_traced_memory()[1] - baseline
+
+    kept = []
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(iterations):
+        kept.append(build())
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return peaks / iterations, (after - before) / iterations
+
+def instance_size(instance):
+    size = sys.getsizeof(instance)
+    if hasattr(instance, "__dict__"):
+        size += sys.getsizeof(instance.__dict__)
+    return size
+
+def main():
+    args = parse_args()
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "iterations": args.iterations
+        },
+        "cases": {}
+    }
+
+    print(f"{'case':<20}{'cpu us':>10}{'peak bytes':>14}{'kept bytes':>14}{'instance bytes':>16}")
+    for name, build in CASES.items():
+        build()
+        cpu = cpu_per_call(build, args.iterations, args.repeat)
+        peak, kept = memory_per_call(build, args.iterations)
+        size = instance_size(build())
+
+        results["cases"][name] = {"cpu_us": cpu * 1e6, "peak_bytes": peak, "kept_bytes": kept, "instance_bytes": size}
+        print(f"{name:<20}{cpu * 1e6:>10.2f}{peak:>14.1f}{kept:>14.1f}{size:>16}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=4)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
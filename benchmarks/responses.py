@@ -0,0 +1,95 @@
+"""
+    Benchmark of building JSON responses with jsonify against rpi.responses.
+
+    Each case builds complete Flask responses from concurrency threads inside a request context, the same way the
+    routes do, and reports throughput and CPU time per response. Cases cover a fixed error body and a box state body.
+
+    Usage:
+        python -m benchmarks.responses --concurrency 8 --iterations 20000 --output responses.json
+"""
+import json
+import time
+import argparse
+import platform
+
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask, jsonify
+
+from rpi import responses
+from rpi.pelbox_member import PelBox
+
+PELBOX = PelBox.from_row((3, "security-key", "user-security-key", "127.0.0.1", 42, True, False, False, 2, False))
+
+app = Flask(__name__)
+
+CASES = {
+    "error_jsonify": lambda: app.make_response((jsonify({"success": False, "error": "Missing arguments"}), 400, {"ContentType":"application/json"})),
+    "error_static": lambda: responses.static_response("missing_arguments"),
+    "state_jsonify": lambda: app.make_response((jsonify({"success": True, "settings": PELBOX.json_data()}), 200, {"ContentType":"application/json"})),
+    "state_direct": lambda: responses.box_state_response(True, PELBOX)
+}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark JSON response building")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=20000, help="responses per case")
+    parser.add_argument("--output", help="JSON file to write results to")
+    return parser.parse_args()
+
+def check_same_body():
+    """
+        Fast responses have to carry the same JSON as jsonify ones, key order aside.
+    """
+    with app.test_request_context():
+        for slow, fast in (("error_jsonify", "error_static"), ("state_jsonify", "state_direct")):
+            slow_response, fast_response = CASES[slow](), CASES[fast]()
+            assert json.loads(slow_response.get_data()) == json.loads(fast_response.get_data()), f"{fast} body differs from {slow}"
+            assert slow_response.status_code == fast_response.status_code, f"{fast} status differs from {slow}"
+
+def run_case(build, iterations, concurrency):
+    per_thread = iterations // concurrency
+
+    def work(_):
+        with app.test_request_context():
+            for _ in range(per_thread):
+                build().get_data()
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(work, range(concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+
+    total = per_thread * concurrency
+    return {"responses": total, "throughput_rps": total / elapsed, "cpu_us": cpu / total * 1e6}
+
+def main():
+    args = parse_args()
+    check_same_body()
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "encoder": responses.encoder_name,
+            "concurrency": args.concurrency,
+            "iterations": args.iterations
+        },
+        "cases": {}
+    }
+
+    print(f"{'case':<16}{'rps':>12}{'cpu us':>10}")
+    for name, build in CASES.items():
+        run_case(build, min(args.iterations, 1000), args.concurrency)
+        result = results["cases"][name] = run_case(build, args.iterations, args.concurrency)
+        print(f"{name:<16}{result['throughput_rps']:>12.0f}{result['cpu_us']:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=4)
+        print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+"""
+    Endpoint benchmark of the management blueprint.
+
+    Boots the blueprint against a local fake Keycloak, a local PostgreSQL database and simulated GPIO, drives each
+    route at the given concurrency and writes latency histograms and throughput to a JSON baseline file.
+
+    Usage:
+        python -m benchmarks.run --db-name pelbox_bench --concurrency 8 --requests 500 --output baseline.json
+        python -m benchmarks.run --db-name pelbox_bench --compare baseline.json
+
+    The database has to exist, benchmark tables from benchmarks/schema.sql are created and seeded on start.
+    Never point it at a production database, box state rows of the benchmark members are overwritten.
+"""
+import os
+import json
+import time
+import bisect
+import argparse
+import platform
+import threading
+import subprocess
+
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2
+import requests
+
+from benchmarks.fake_keycloak import FakeKeycloak
+
+ROUTES = ["locking_state", "set_locking", "dismantle_state", "set_dismantle", "set_expanding_value", "set_door_status"]
+HISTOGRAM_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+APP_SECRET = "benchmark-secret"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark rpi.management endpoints")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="requests per route")
+    parser.add_argument("--warmup", type=int, default=20, help="warmup requests per route, not recorded")
+    parser.add_argument("--members", type=int, default=16, help="number of seeded members, requests rotate over them")
+    parser.add_argument("--routes", nargs="+", default=ROUTES, choices=ROUTES)
+    parser.add_argument("--keycloak-latency", type=float, default=0, help="seconds added to every fake Keycloak response")
+    parser.add_argument("--local-verify", action="store_true", help="verify member tokens locally")
+    parser.add_argument("--gpio-speedup", type=float, default=1000)
+    parser.add_argument("--conditional", action="store_true", help="send If-None-Match with the last ETag on state routes")
+    parser.add_argument("--db-host", default=os.environ.get("BENCH_DB_HOST", "127.0.0.1"))
+    parser.add_argument("--db-port", default=os.environ.get("BENCH_DB_PORT", "5432"))
+    parser.add_argument("--db-name", default=os.environ.get("BENCH_DB_NAME", "pelbox_bench"))
+    parser.add_argument("--db-user", default=os.environ.get("BENCH_DB_USER", "postgres"))
+    parser.add_argument("--db-password", default=os.environ.get("BENCH_DB_PASSWORD", ""))
+    parser.add_argument("--output", default="benchmarks/baseline.json")
+    parser.add_argument("--compare", help="previous baseline file to compare the results with")
+    return parser.parse_args()
+
+def configure_environment(args, keycloak):
+    """
+        Environment has to be set before rpi.management is imported, it reads its configuration on import.
+    """
+    os.environ.update({
+        "APP_SECRET": APP_SECRET,
+        "DB_HOST": args.db_host,
+        "DB_PORT": str(args.db_port),
+        "DB_NAME": args.db_name,
+        "DB_USER": args.db_user,
+        "DB_PASSWORD": args.db_password,
+        "DB_POOL_MAX": str(max(args.concurrency, 1) + 2),
+        "KEYCLOAK_HOST": keycloak.host,
+        "KEYCLOAK_ISSUER": keycloak.issuer,
+        "KEYCLOAK_AUDIENCE": "account",
+        "KEYCLOAK_LOCAL_VERIFY": "true" if args.local_verify else "false",
+        "ADMIN_CLIENT_SECRET": "benchmark",
+        "MEMBER_CLIENT_SECRET": "benchmark",
+        "GPIO_BACKEND": "simulated",
+        "GPIO_SIM_SPEEDUP": str(args.gpio_speedup)
+    })
+
+def seed_database(args):
+    usernames = [f"bench-user-{i}" for i in range(args.members)]
+    conn = psycopg2.connect(host=args.db_host, port=args.db_port, database=args.db_name, user=args.db_user, password=args.db_password)
+    with conn, conn.cursor() as cur:
+        with open(os.path.join(os.path.dirname(__file__), "schema.sql")) as schema:
+            cur.execute(schema.read())
+
+        for username in usernames:
+            cur.execute("""
+                INSERT INTO members (username, email, phone_token) VALUES (%s, %s, '')
+                ON CONFLICT (username) DO UPDATE SET email = EXCLUDED.email
+                RETURNING id
+            """, (username, f"{username}@benchmark.local"))
+            member_id = cur.fetchone()[0]
+
+            cur.execute("INSERT INTO member_details (member_id, first_name) VALUES (%s, %s) ON CONFLICT DO NOTHING", (member_id, username))
+            cur.execute("""
+                INSERT INTO rpi_devices (security_key, user_security_key, host, member_id, connected) VALUES (%s, %s, '127.0.0.1', %s, false)
+                ON CONFLICT (member_id) DO UPDATE SET security_key = EXCLUDED.security_key, user_security_key = EXCLUDED.user_security_key
+            """, (APP_SECRET, APP_SECRET, member_id))
+            cur.execute("""
+                INSERT INTO box_locking (member_id) VALUES (%s)
+                ON CONFLICT (member_id) DO UPDATE SET locked = false, dismantle = false, expanding_value = 0, door_open = false
+            """, (member_id,))
+    conn.close()
+    return usernames
+
+def start_server():
+    from werkzeug.serving import make_server
+    from main import app
+
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="benchmark-server", daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    deadline = time.monotonic() + 30
+    while requests.get(base_url + "/ready", timeout=5).status_code != 200:
+        if time.monotonic() > deadline:
+            raise RuntimeError("Service didn't get ready within 30 seconds")
+        time.sleep(0.1)
+    return server, base_url
+
+def request_for(route, token, i):
+    """
+        Returns method, path, headers and body of the i-th request to the route.
+    """
+    if route in ("locking_state", "dismantle_state"):
+        return "GET", f"/{route}", {"Access-Token": token}, None
+    if route == "set_locking":
+        return "PUT", "/set_locking", {}, {"access_token": token, "locked": i % 2 == 0}
+    if route == "set_dismantle":
+        return "PUT", "/set_dismantle", {}, {"access_token": token, "dismantle": i % 2 == 0}
+    if route == "set_expanding_value":
+        return "PUT", "/set_expanding_value", {}, {"access_token": token, "expanding-value": i % 6}
+    return "PUT", "/set_door_status", {}, {"access_token": token, "door_status": "open" if i % 2 == 0 else "close"}
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))]
+
+def summarize(latencies, statuses, elapsed):
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for latency in latencies_ms:
+        histogram[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, latency)] += 1
+
+    status_codes = {}
+    for status in statuses:
+        status_codes[str(status)] = status_codes.get(str(status), 0) + 1
+
+    return {
+        "requests": len(latencies_ms),
+        "errors": sum(count for status, count in status_codes.items() if not status.startswith("2") and status != "304"),
+        "status_codes": status_codes,
+        "throughput_rps": len(latencies_ms) / elapsed if elapsed else None,
+        "latency_ms": {
+            "min": latencies_ms[0] if latencies_ms else None,
+            "mean": sum(latencies_ms) / len(latencies_ms) if latencies_ms else None,
+            "p50": percentile(latencies_ms, 0.50),
+            "p90": percentile(latencies_ms, 0.90),
+            "p99": percentile(latencies_ms, 0.99),
+            "max": latencies_ms[-1] if latencies_ms else None
+        },
+        "histogram_ms": {f"le_{bucket}": count for bucket, count in zip(HISTOGRAM_BUCKETS_MS + ["inf"], histogram)}
+    }
+
+def drive(base_url, route, tokens, count, concurrency, conditional=False):
+    """
+        Send count requests to the route from concurrency threads, returns latencies and status codes.
+
+        With conditional each thread remembers the last ETag per token and sends it as If-None-Match.
+    """
+    local = threading.local()
+    latencies = [None] * count
+    statuses = [None] * count
+
+    def send(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.etags = {}
+
+        token = tokens[i % len(tokens)]
+        method, path, headers, body = request_for(route, token, i)
+        if conditional and token in local.etags:
+            headers["If-None-Match"] = local.etags[token]
+
+        started = time.perf_counter()
+        try:
+            response = local.session.request(method, base_url + path, headers=headers, data=None if body is None else json.dumps(body), timeout=60)
+            statuses[i] = response.status_code
+            if "ETag" in response.headers:
+                local.etags[token] = response.headers["ETag"]
+        except requests.exceptions.RequestException:
+            statuses[i] = "error"
+        latencies[i] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(send, range(count)))
+    return latencies, statuses, time.perf_counter() - started
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, previous_path):
+    with open(previous_path) as previous_file:
+        previous = json.load(previous_file)
+
+    print(f"\n{'route':<22}{'p50 ms':>18}{'p99 ms':>18}{'rps':>18}")
+    for route, result in results["routes"].items():
+        before = previous.get("routes", {}).get(route)
+        if before is None:
+            continue
+
+        def delta(old, new):
+            if old in (None, 0) or new is None:
+                return f"{new}"
+            return f"{new:.1f} ({(new - old) / old * 100:+.0f}%)"
+
+        print(f"{route:<22}"
+              f"{delta(before['latency_ms']['p50'], result['latency_ms']['p50']):>18}"
+              f"{delta(before['latency_ms']['p99'], result['latency_ms']['p99']):>18}"
+              f"{delta(before['throughput_rps'], result['throughput_rps']):>18}")
+
+def main():
+    args = parse_args()
+
+    keycloak = FakeKeycloak(latency=args.keycloak_latency).start()
+    configure_environment(args, keycloak)
+    usernames = seed_database(args)
+    tokens = [keycloak.member_token(username) for username in usernames]
+
+    server, base_url = start_server()
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "members": args.members,
+            "keycloak_latency": args.keycloak_latency,
+            "local_verify": args.local_verify,
+            "conditional": args.conditional
+        },
+        "routes": {}
+    }
+
+    for route in args.routes:
+        drive(base_url, route, tokens, args.warmup, args.concurrency, args.conditional)
+        keycloak.calls.clear()
+
+        latencies, statuses, elapsed = drive(base_url, route, tokens, args.requests, args.concurrency, args.conditional)
+        results["routes"][route] = summarize(latencies, statuses, elapsed)
+        results["routes"][route]["keycloak_calls"] = dict(keycloak.calls)
+
+        latency = results["routes"][route]["latency_ms"]
+        print(f"{route:<22} {results['routes'][route]['throughput_rps']:8.1f} rps  p50 {latency['p50']:8.2f} ms  p99 {latency['p99']:8.2f} ms")
+
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=4)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+    server.shutdown()
+    keycloak.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+-- Minimal schema of the tables used by rpi.management, for benchmark databases only.
+
+CREATE TABLE IF NOT EXISTS organizations (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    email VARCHAR(255)
+);
+
+CREATE TABLE IF NOT EXISTS members (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(255) NOT NULL UNIQUE,
+    email VARCHAR(255) NOT NULL UNIQUE,
+    phone_token VARCHAR(255),
+    organization_id INTEGER REFERENCES organizations (id)
+);
+
+CREATE TABLE IF NOT EXISTS member_details (
+    member_id INTEGER PRIMARY KEY REFERENCES members (id),
+    first_name VARCHAR(255),
+    last_name VARCHAR(255),
+    gender VARCHAR(32),
+    country VARCHAR(255),
+    city VARCHAR(255),
+    city_address VARCHAR(255),
+    postal_code VARCHAR(32),
+    phone_number VARCHAR(64)
+);
+
+CREATE TABLE IF NOT EXISTS rpi_devices (
+    id SERIAL PRIMARY KEY,
+    security_key VARCHAR(255),
+    user_security_key VARCHAR(255),
+    host VARCHAR(255),
+    member_id INTEGER NOT NULL UNIQUE REFERENCES members (id),
+    connected BOOLEAN NOT NULL DEFAULT false
+);
+
+CREATE TABLE IF NOT EXISTS box_locking (
+    member_id INTEGER PRIMARY KEY REFERENCES members (id),
+    locked BOOLEAN NOT NULL DEFAULT false,
+    dismantle BOOLEAN NOT NULL DEFAULT false,
+    expanding_value INTEGER NOT NULL DEFAULT 0,
+    door_open BOOLEAN NOT NULL DEFAULT false
+);
@@ -1,11 +1,65 @@
+import time
+started = time.perf_counter()
+
+import signal
+import logging
 from flask import Flask
-from rpi.management import management
+from environs import Env
+from rpi.management import management, controller, startup
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+env = Env()
+env.read_env()
 
 app = Flask(__name__)
 app.register_blueprint(management)
 
+startup.mark("imports", time.perf_counter() - started)
+startup.start()
+
+def stop(signum, frame):
+    raise SystemExit(0)
+
+def serve_production(host, port):
+    """
+        Serve the app with waitress in a single process with a pool of worker threads.
+
+        With the local hardware controller the single process owns the GPIO pins. On SIGTERM or SIGINT waitress stops serving and
+        waits its own fixed 5 seconds for worker threads, then queued hardware jobs get up to SERVER_DRAIN_TIMEOUT seconds to finish.
+    """
+    from waitress.server import create_server
+
+    server = create_server(app,
+                           host=host,
+                           port=port,
+                           threads=env.int("SERVER_THREADS", 8),
+                           backlog=env.int("SERVER_BACKLOG", 64),
+                           connection_limit=env.int("SERVER_CONNECTION_LIMIT", 100),
+                           channel_timeout=env.int("SERVER_CHANNEL_TIMEOUT", 30),
+                           ident="pelbox")
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    log.info(f"Serving on http://{host}:{port} with {env.int('SERVER_THREADS', 8)} threads")
+    try:
+        server.run()
+    finally:
+        log.info("Server stopped. Waiting for queued hardware jobs to finish")
+        controller.shutdown(timeout=env.float("SERVER_DRAIN_TIMEOUT", 30))
+
 def main():
-    app.run(host='0.0.0.0', port=9002)
+    host = env.str("SERVER_HOST", "0.0.0.0")
+    port = env.int("SERVER_PORT", 9002)
+
+    if env.str("SERVER_MODE", "development") == "production":
+        serve_production(host, port)
+    else:
+        app.run(host=host, port=port)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
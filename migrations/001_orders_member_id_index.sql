@@ -0,0 +1,2 @@
+-- Keyset pagination of member orders reads orders of one member newest first, starting below an order id.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS orders_member_id_id_idx ON orders (member_id, id DESC);
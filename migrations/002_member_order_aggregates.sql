@@ -0,0 +1,59 @@
+-- Order count and total per member, kept current by triggers on orders so reading them doesn't scan order history.
+-- Existing orders are counted in the same transaction, with orders locked against writes until the trigger is in place.
+-- python -m rpi.order_aggregates rebuild recomputes the table later if it ever drifts.
+BEGIN;
+
+LOCK TABLE orders IN SHARE MODE;
+
+CREATE TABLE IF NOT EXISTS member_order_aggregates (
+    member_id integer PRIMARY KEY,
+    order_count bigint NOT NULL DEFAULT 0,
+    order_total numeric NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION member_order_aggregates_add(p_member_id integer, p_count bigint, p_total numeric)
+RETURNS void AS $$
+BEGIN
+    IF p_member_id IS NULL THEN
+        RETURN;
+    END IF;
+
+    INSERT INTO member_order_aggregates AS a (member_id, order_count, order_total)
+    VALUES (p_member_id, p_count, coalesce(p_total, 0))
+    ON CONFLICT (member_id) DO UPDATE
+    SET order_count = a.order_count + EXCLUDED.order_count,
+        order_total = a.order_total + EXCLUDED.order_total,
+        updated_at = now();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION member_order_aggregates_trigger()
+RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM member_order_aggregates_add(NEW.member_id, 1, NEW.price);
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM member_order_aggregates_add(OLD.member_id, -1, -OLD.price);
+    ELSIF NEW.member_id IS DISTINCT FROM OLD.member_id OR NEW.price IS DISTINCT FROM OLD.price THEN
+        PERFORM member_order_aggregates_add(OLD.member_id, -1, -OLD.price);
+        PERFORM member_order_aggregates_add(NEW.member_id, 1, NEW.price);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS orders_member_order_aggregates ON orders;
+CREATE TRIGGER orders_member_order_aggregates
+AFTER INSERT OR UPDATE OR DELETE ON orders
+FOR EACH ROW EXECUTE PROCEDURE member_order_aggregates_trigger();
+
+DELETE FROM member_order_aggregates;
+
+INSERT INTO member_order_aggregates (member_id, order_count, order_total)
+SELECT member_id, count(*), coalesce(sum(price), 0)
+FROM orders
+WHERE member_id IS NOT NULL
+GROUP BY member_id;
+
+COMMIT;
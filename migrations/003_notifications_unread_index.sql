@@ -0,0 +1,3 @@
+-- Unread notifications of a member, used by delta sync and bulk mark read. Read notifications are left out of the
+-- index so it stays small however many notifications members have read.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS notifications_unread_member_id_idx ON notifications (member_id) WHERE is_read = false;
@@ -0,0 +1,106 @@
+import time
+import uuid
+import queue
+import logging
+import threading
+
+from collections import OrderedDict
+
+from rpi.metrics import registry
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+class Job:
+    def __init__(self, name, owner, func, args):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.owner = owner
+        self.func = func
+        self.args = args
+
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def json_data(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+class Actuator:
+    def __init__(self, history_size=256):
+        """
+            Runs hardware jobs one after another on a dedicated worker thread.
+
+            Jobs are kept after they finish so their status can be queried, only the last history_size
+            jobs are remembered.
+        """
+        self.history_size = history_size
+        self.queue = queue.Queue()
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.worker = threading.Thread(target=self.run, name="actuator", daemon=True)
+        self.worker.start()
+
+    def submit(self, name, owner, func, *args):
+        """
+            Queue func(*args) and return its Job right away. Value returned by func is kept as job result.
+        """
+        job = Job(name, owner, func, args)
+        with self.lock:
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.history_size:
+                self.jobs.popitem(last=False)
+
+        self.queue.put(job)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+
+            job.status = "running"
+            job.started_at = time.time()
+            registry.observe("pelbox_actuator_queue_wait_seconds", job.started_at - job.created_at, {"job": job.name})
+            try:
+                job.result = job.func(*job.args)
+                job.status = "done"
+            except Exception as e:
+                log.critical(f"Actuator job {job.name} {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+                registry.observe("pelbox_actuator_job_seconds", job.finished_at - job.started_at, {"job": job.name, "status": job.status})
+                job.func = None
+                job.args = None
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def shutdown(self, timeout=None):
+        """
+            Stop the worker after already queued jobs are finished.
+        """
+        self.queue.put(None)
+        self.worker.join(timeout)
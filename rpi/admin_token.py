@@ -0,0 +1,113 @@
+import time
+import logging
+import threading
+import jwt
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+def token_expiry(token):
+    """
+        Returns exp claim of the token as unix time or None if token has no exp.
+    """
+    if token is None:
+        return None
+    try:
+        return jwt.decode(token, verify=False).get("exp")
+    except jwt.exceptions.DecodeError as e:
+        log.critical(e)
+        return None
+
+class AdminTokenManager:
+    def __init__(self, log_in, refresh, refresh_margin=30, retry_interval=10):
+        """
+            Holds admin-cli tokens and renews them shortly before they expire.
+
+            log_in and refresh are callables performing admin login and refresh token grant. Both return
+            True on success and store new tokens through set_tokens. Renewal runs on a background timer so
+            callers always read the current access token without waiting.
+        """
+        self.log_in = log_in
+        self.refresh = refresh
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+
+        self.access_token = None
+        self.refresh_token = None
+        self.access_expires_at = None
+        self.refresh_expires_at = None
+
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def set_tokens(self, access_token, refresh_token):
+        """
+            Store new tokens and schedule the next renewal based on access token exp.
+        """
+        self.access_expires_at = token_expiry(access_token)
+        self.refresh_expires_at = token_expiry(refresh_token)
+        self.refresh_token = refresh_token
+        self.access_token = access_token
+
+        if self.access_expires_at is not None:
+            self.schedule(self.access_expires_at - self.refresh_margin - time.time())
+
+    def schedule(self, delay):
+        if self.timer is not None:
+            self.timer.cancel()
+
+        self.timer = threading.Timer(max(delay, 0), self.renew_in_background)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def is_expired(self):
+        """
+            Check is access token missing or about to expire.
+        """
+        return self.access_token is None or (self.access_expires_at is not None and self.access_expires_at - self.refresh_margin <= time.time())
+
+    def renew_in_background(self):
+        with self.lock:
+            try:
+                renewed = self.renew()
+            except Exception as e:
+                log.critical(e)
+                renewed = False
+
+            if not renewed:
+                log.critical(f"Keycloak admin token renewal failed. Retrying in {self.retry_interval} seconds")
+                self.schedule(self.retry_interval)
+
+    def renew(self):
+        """
+            Get new tokens using refresh token while it is valid, otherwise perform new admin login.
+        """
+        refresh_valid = self.refresh_token is not None and (self.refresh_expires_at is None or self.refresh_expires_at - self.refresh_margin > time.time())
+        if refresh_valid:
+            log.info("Refreshing Keycloak admin token before it expires")
+            return self.refresh()
+
+        log.info("Keycloak admin refresh token expired. New admin login.")
+        return self.log_in()
+
+    def ensure_valid(self):
+        """
+            Renew tokens now if the background renewal didn't happen in time.
+        """
+        if self.is_expired():
+            with self.lock:
+                if self.is_expired():
+                    self.renew()
+
+    def reject(self, access_token):
+        """
+            Called when Keycloak answers 401 for the given access token.
+
+            Only the first caller that saw the rejected token performs admin login, the rest reuse its result.
+        """
+        with self.lock:
+            if self.access_token == access_token:
+                log.info("Keycloak admin token not valid. New admin login.")
+                self.log_in()
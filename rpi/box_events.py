@@ -0,0 +1,161 @@
+import json
+import queue
+import select
+import logging
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+from rpi.metrics import registry
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+CHANNEL = "box_state"
+RESYNC = "resync"
+
+class BoxEventBus:
+    def __init__(self, queue_size=64):
+        """
+            Fans box state changes out to subscribers of the box owner.
+
+            Every subscriber has its own bounded queue. A subscriber too slow to keep up gets RESYNC instead of
+            the lost changes and is expected to read full state again. Observers are called with
+            (member_id, changes) on every change and with (None, RESYNC) on resync.
+        """
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.observers = []
+        self.lock = threading.Lock()
+
+    def observe(self, callback):
+        self.observers.append(callback)
+
+    def subscribe(self, member_id):
+        subscriber = queue.Queue(self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(member_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, member_id, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(member_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[member_id]
+
+    def publish(self, member_id, changes):
+        for observer in self.observers:
+            observer(member_id, changes)
+
+        with self.lock:
+            subscribers = list(self.subscribers.get(member_id, ()))
+
+        for subscriber in subscribers:
+            self.put(subscriber, changes)
+
+    def resync_all(self):
+        """
+            Tell every subscriber changes may have been missed, used after the listener lost its connection.
+        """
+        for observer in self.observers:
+            observer(None, RESYNC)
+
+        with self.lock:
+            subscribers = [subscriber for member_subscribers in self.subscribers.values() for subscriber in member_subscribers]
+
+        for subscriber in subscribers:
+            self.put(subscriber, RESYNC)
+
+    def put(self, subscriber, event):
+        try:
+            subscriber.put_nowait(event)
+        except queue.Full:
+            while True:
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    break
+            subscriber.put_nowait(RESYNC)
+
+    def count(self):
+        with self.lock:
+            return sum(len(subscribers) for subscribers in self.subscribers.values())
+
+class BoxStateListener:
+    def __init__(self, bus, connect_kwargs, channel=CHANNEL, reconnect_interval=5):
+        """
+            Background thread running LISTEN on its own connection and publishing notifications to the bus.
+
+            Notifications are sent by common.update_box_state in the same transaction as the update, so changes
+            made by any process, including the hardware controller daemon, reach the bus after they commit.
+        """
+        self.bus = bus
+        self.connect_kwargs = connect_kwargs
+        self.channel = channel
+        self.reconnect_interval = reconnect_interval
+
+        self.thread = None
+        self.listening = False
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+            Start listening unless already started. Safe to call on every new subscription.
+        """
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="box-state-listener", daemon=True)
+                self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+
+    def run(self):
+        while not self.stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**self.connect_kwargs)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {self.channel}")
+                log.info(f"Listening for {self.channel} notifications")
+
+                # Changes committed while the listener was disconnected were missed
+                self.bus.resync_all()
+                self.listening = True
+                self.listen(conn)
+            except psycopg2.Error as e:
+                log.critical(f"Box state listener failed: {e}")
+                registry.inc("pelbox_box_events_listener_errors_total")
+            finally:
+                self.listening = False
+                if conn is not None:
+                    conn.close()
+
+            self.stopping.wait(self.reconnect_interval)
+
+    def listen(self, conn):
+        while not self.stopping.is_set():
+            if select.select([conn], [], [], 5) == ([], [], []):
+                # Ping so a silently dropped connection is noticed and cached state stops being trusted
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                continue
+
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                try:
+                    event = json.loads(notify.payload)
+                except ValueError as e:
+                    log.warning(f"Ignoring malformed {self.channel} notification: {e}")
+                    continue
+
+                registry.inc("pelbox_box_events_total")
+                self.bus.publish(event["member_id"], event["changes"])
@@ -1,10 +1,13 @@
-import psycopg2
+import time
 import logging
 import requests
 from environs import Env
 
 import simplejson as sjson
 
+from rpi.db import ConnectionPool
+from rpi.metrics import registry, timed_query
+
 logging.basicConfig()
 log = logging.getLogger()
 logging.root.setLevel(logging.NOTSET)
@@ -13,17 +16,17 @@ logging.basicConfig(level=logging.NOTSET)
 env = Env()
 env.read_env()
 
-try:
-    log.info(f"Connecting to {env.str('DB_NAME')} database from rpi.common module")
-    conn = psycopg2.connect(host=env.str("DB_HOST"),
-                            port=env.str("DB_PORT"),
-                            database=env.str("DB_NAME"),
-                            user=env.str("DB_USER"),
-                            password=env.str("DB_PASSWORD"))
-    log.info(f"Connected to {env.str('DB_NAME')} database")
-except Exception as e:
-    log.critical(e)
-
+pool = ConnectionPool(minconn=env.int("DB_POOL_MIN", 1),
+                      maxconn=env.int("DB_POOL_MAX", 5),
+                      timeout=env.float("DB_POOL_TIMEOUT", 10),
+                      idle_check=env.float("DB_POOL_IDLE_CHECK", 30),
+                      host=env.str("DB_HOST"),
+                      port=env.str("DB_PORT"),
+                      database=env.str("DB_NAME"),
+                      user=env.str("DB_USER"),
+                      password=env.str("DB_PASSWORD"))
+
+@timed_query
 def member_exists(username, email):
     """
         Fetches rows from a memembers table.
@@ -38,662 +41,805 @@ def member_exists(username, email):
             If there are any rows matching username or an email returns True, otherwise False
     """
     try:
-        cur = conn.cursor()
-        query = "SELECT * FROM members WHERE username = %s OR email = %s"
+        with pool.transaction() as cur:
+            query = "SELECT * FROM members WHERE username = %s OR email = %s"
 
-        cur.execute(query, (username, email))
-        row = cur.fetchone()
-        cur.close()
+            cur.execute(query, (username, email))
+            row = cur.fetchone()
 
-        return row
+            return row
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def get_member_details(username):
     """
         Returns member details by the username provided.
     """
     try:
-        cur = conn.cursor()
-        query = """
-            SELECT m.id, m.username, m.email, md.first_name, md.last_name, md.gender, md.country, md.city, md.city_address, md.postal_code, md.phone_number, m.phone_token, o.name as organization_name, m.organization_id, o.email
-            FROM members m
-            INNER JOIN member_details md ON m.id = md.member_id
-            LEFT JOIN organizations o ON m.organization_id = o.id
-            WHERE m.username = %s;
-        """
-
-        cur.execute(query, (username,))
-        row = cur.fetchone()
-        cur.close()
-
-        return row
+        with pool.transaction() as cur:
+            query = """
+                SELECT m.id, m.username, m.email, md.first_name, md.last_name, md.gender, md.country, md.city, md.city_address, md.postal_code, md.phone_number, m.phone_token, o.name as organization_name, m.organization_id, o.email
+                FROM members m
+                INNER JOIN member_details md ON m.id = md.member_id
+                LEFT JOIN organizations o ON m.organization_id = o.id
+                WHERE m.username = %s;
+            """
+
+            cur.execute(query, (username,))
+            row = cur.fetchone()
+
+            return row
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def get_pelbox_settings(member_id):
     """
         Returns pelbox details by the member id provided.
     """
     try:
-        cur = conn.cursor()
-        query = """
-           	SELECT rd.id, rd.security_key, rd.user_security_key, rd.host, rd.member_id, rd.connected, bl.locked, bl.dismantle, bl.expanding_value, bl.door_open
-           	FROM rpi_devices rd
-            INNER JOIN box_locking bl ON bl.member_id = rd.member_id
-           	WHERE rd.member_id = %s
-        """
-
-        cur.execute(query, (member_id,))
-        row = cur.fetchone()
-        cur.close()
-
-        return row
+        with pool.transaction() as cur:
+            query = """
+               	SELECT rd.id, rd.security_key, rd.user_security_key, rd.host, rd.member_id, rd.connected, bl.locked, bl.dismantle, bl.expanding_value, bl.door_open
+               	FROM rpi_devices rd
+                INNER JOIN box_locking bl ON bl.member_id = rd.member_id
+               	WHERE rd.member_id = %s
+            """
+
+            cur.execute(query, (member_id,))
+            row = cur.fetchone()
+
+            return row
+    except Exception as e:
+        log.critical(e)
+
+@timed_query
+def get_device_context(username):
+    """
+        Returns member id together with pelbox details by the username provided.
+
+        Row starts with member id followed by the same columns as get_pelbox_settings.
+    """
+    try:
+        with pool.transaction() as cur:
+            query = """
+                SELECT m.id, rd.id, rd.security_key, rd.user_security_key, rd.host, rd.member_id, rd.connected, bl.locked, bl.dismantle, bl.expanding_value, bl.door_open
+                FROM members m
+                INNER JOIN rpi_devices rd ON rd.member_id = m.id
+                INNER JOIN box_locking bl ON bl.member_id = m.id
+                WHERE m.username = $1
+            """
+
+            pool.execute_prepared(cur, "get_device_context", query, (username,))
+            row = cur.fetchone()
+
+            return row
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def update_first_name(first_name, username):
     """
         Updates member first name by the first_name provided where the key is username.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            UPDATE member_details md
-            SET first_name = %s
-            FROM member_information
-            WHERE md.member_id = member_information.id
-        """
-
-        cur.execute(query, (username,first_name))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS 
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                UPDATE member_details md
+                SET first_name = %s
+                FROM member_information
+                WHERE md.member_id = member_information.id
+            """
+
+            cur.execute(query, (username,first_name))
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def update_last_name(last_name, username):
     """
         Updates member last name by the last_name provided where the key is username.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            UPDATE member_details md
-            SET last_name = %s
-            FROM member_information
-            WHERE md.member_id = member_information.id
-        """
-
-        cur.execute(query, (username,last_name))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS 
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                UPDATE member_details md
+                SET last_name = %s
+                FROM member_information
+                WHERE md.member_id = member_information.id
+            """
+
+            cur.execute(query, (username,last_name))
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def update_city(city, username):
     """
         Updates member city by the city provided where the key is username.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            UPDATE member_details md
-            SET city = %s
-            FROM member_information
-            WHERE md.member_id = member_information.id
-        """
-
-        cur.execute(query, (username,city))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS 
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                UPDATE member_details md
+                SET city = %s
+                FROM member_information
+                WHERE md.member_id = member_information.id
+            """
+
+            cur.execute(query, (username,city))
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def update_city_address(city_address, username):
     """
         Updates member city_address by the city_address provided where the key is username.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            UPDATE member_details md
-            SET city_address = %s
-            FROM member_information
-            WHERE md.member_id = member_information.id
-        """
-
-        cur.execute(query, (username,city_address))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS 
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                UPDATE member_details md
+                SET city_address = %s
+                FROM member_information
+                WHERE md.member_id = member_information.id
+            """
+
+            cur.execute(query, (username,city_address))
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def update_postal_code(postal_code, username):
     """
         Updates member postal_code by the postal_code provided where the key is username.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            UPDATE member_details md
-            SET postal_code = %s
-            FROM member_information
-            WHERE md.member_id = member_information.id
-        """
-
-        cur.execute(query, (username,postal_code))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS 
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                UPDATE member_details md
+                SET postal_code = %s
+                FROM member_information
+                WHERE md.member_id = member_information.id
+            """
+
+            cur.execute(query, (username,postal_code))
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def get_countries():
     """
         Return all countries with country codes.
     """
     try:
-        cur = conn.cursor()
+        with pool.transaction() as cur:
+            query = """
+                SELECT id, name, code 
+                FROM country_list
+            """
 
-        query = """
-            SELECT id, name, code 
-            FROM country_list
-        """
+            cur.execute(query)
+            rows = cur.fetchall()
 
-        cur.execute(query)
-        rows = cur.fetchall()
-        cur.close()
-
-        return [{row[2].lower(): {"id": row[0], "name": row[1]}} for row in rows]
+            return [{row[2].lower(): {"id": row[0], "name": row[1]}} for row in rows]
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def update_member_country_name(country_name, username):
     """
         Updates member country_name by the country_name provided where the key is username.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            UPDATE member_details md
-            SET country = %s
-            FROM member_information
-            WHERE md.member_id = member_information.id
-        """
-
-        cur.execute(query, (username,country_name))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS 
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                UPDATE member_details md
+                SET country = %s
+                FROM member_information
+                WHERE md.member_id = member_information.id
+            """
+
+            cur.execute(query, (username,country_name))
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def get_country_code_by_country_name(country_name):
     """
         Returns country code by country name.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            SELECT code FROM country_list
-            WHERE name = %s
-        """
+        with pool.transaction() as cur:
+            query = """
+                SELECT code FROM country_list
+                WHERE name = %s
+            """
 
-        cur.execute(query, (country_name,))
-        row = cur.fetchone()
+            cur.execute(query, (country_name,))
+            row = cur.fetchone()
 
-        return row
+            return row
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def is_member_in_organization(username):
     """
         Checks is member in organization.
     """
     try:
-        cur = conn.cursor()
+        with pool.transaction() as cur:
+            query = """
+                SELECT organization_id FROM members
+                WHERE username = %s
+            """
 
-        query = """
-            SELECT organization_id FROM members
-            WHERE username = %s
-        """
+            cur.execute(query, (username,))
+            row = cur.fetchone()
 
-        cur.execute(query, (username,))
-        row = cur.fetchone()
-
-        return row
+            return row
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def update_member_gender(gender, username):
     """
         Updates member gender by the gender provided where the key is username.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            UPDATE member_details md
-            SET gender = %s
-            FROM member_information
-            WHERE md.member_id = member_information.id
-        """
-
-        cur.execute(query, (username,gender))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS 
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                UPDATE member_details md
+                SET gender = %s
+                FROM member_information
+                WHERE md.member_id = member_information.id
+            """
+
+            cur.execute(query, (username,gender))
     except Exception as e:
         log.critical(e)
 
+@timed_query
 def get_member_orders_details_all(username):
     """
         Return count and sum of all member orders
+
+        Read from member_order_aggregates kept by triggers on orders, so it doesn't depend on order history size.
+        Sum is None for members without orders.
     """
     try:
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            SELECT count(*), sum(o.price)
-            FROM orders o
-            INNER JOIN member_information mi ON mi.id = o.member_id 
-        """
-
-        cur = conn.cursor()
-        cur.execute(query, (username,))
-        
-        row = cur.fetchone()
-
-        cur.close()
-        return row
+        with pool.transaction() as cur:
+            query = """
+                SELECT coalesce(a.order_count, 0), CASE WHEN a.order_count > 0 THEN a.order_total END
+                FROM members m
+                LEFT JOIN member_order_aggregates a ON a.member_id = m.id
+                WHERE m.username = %s
+            """
+
+            cur.execute(query, (username,))
+
+            row = cur.fetchone()
+
+            return row if row is not None else (0, None)
     except Exception as e:
         log.critical(e)
 
-def get_all_member_orders(username):
+@timed_query
+def rebuild_order_aggregates():
     """
-        Return all member orders
+        Recompute member_order_aggregates from orders.
+
+        Orders are locked against writes while the table is rebuilt so no trigger update is lost in between.
+
+        Returns:
+            Number of members with orders, None on error
     """
     try:
-        query = """
-            WITH member_information (id)
-            AS
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            SELECT oc.category_name, o.price, o.product_title, o.product_image, os.status_name, o.product_short_description
-            FROM orders o
-            INNER JOIN member_information mi ON mi.id = o.member_id 
-            INNER JOIN order_category oc ON o.order_category = oc.id
-            INNER JOIN order_status os ON o.product_order_status = os.id 
-        """
-
-        cur = conn.cursor()
-        cur.execute(query, (username,))
-        
-        rows = cur.fetchall()
-        orders = []
-        for row in rows:
-           orders.append(
-               {
-                   "category_name": row[0],
-                   "price": sjson.dumps(row[1], use_decimal=True),
-                   "product_title": row[2],
-                   "product_image": row[3],
-                   "status_name": row[4],
-                   "product_short_description": row[5]
-               }
-           ) 
-
-        cur.close()
-        return orders
+        with pool.transaction() as cur:
+            cur.execute("LOCK TABLE orders IN SHARE MODE")
+            cur.execute("DELETE FROM member_order_aggregates")
+
+            query = """
+                INSERT INTO member_order_aggregates (member_id, order_count, order_total)
+                SELECT member_id, count(*), coalesce(sum(price), 0)
+                FROM orders
+                WHERE member_id IS NOT NULL
+                GROUP BY member_id
+            """
+
+            cur.execute(query)
+
+            return cur.rowcount
     except Exception as e:
         log.critical(e)
 
-def get_unread_notifications(username):
+@timed_query
+def check_order_aggregates():
     """
-        Return all member orders
+        Compare member_order_aggregates with counts and sums computed from orders.
+
+        Returns:
+            List of dicts of members whose aggregates differ, empty when consistent, None on error
     """
     try:
-        query = """
-            WITH member_information (id)
-            AS
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            SELECT n.id, n.notification_title, n.notification_text, n.notification_image_url, n.created_at
-            FROM notifications n
-            INNER JOIN member_information mi ON mi.id = n.member_id 
-            WHERE is_read = false
-        """
-
-        cur = conn.cursor()
-        cur.execute(query, (username,))
-        
-        rows = cur.fetchall()
-        notifications = []
-        for row in rows:
-           notifications.append(
-               {
-                   "id": row[0],
-                   "notification_title": row[1],
-                   "notification_text": row[2],
-                   "notification_image_url": row[3],
-                   "created_at": row[4]
-               }
-           ) 
-
-        cur.close()
-        return notifications
+        with pool.transaction() as cur:
+            query = """
+                WITH expected (member_id, order_count, order_total)
+                AS
+                (
+                    SELECT member_id, count(*), coalesce(sum(price), 0)
+                    FROM orders
+                    WHERE member_id IS NOT NULL
+                    GROUP BY member_id
+                )
+                SELECT coalesce(e.member_id, a.member_id), coalesce(e.order_count, 0), coalesce(e.order_total, 0),
+                       coalesce(a.order_count, 0), coalesce(a.order_total, 0)
+                FROM expected e
+                FULL OUTER JOIN member_order_aggregates a ON a.member_id = e.member_id
+                WHERE coalesce(e.order_count, 0) <> coalesce(a.order_count, 0)
+                   OR coalesce(e.order_total, 0) <> coalesce(a.order_total, 0)
+                ORDER BY 1
+            """
+
+            cur.execute(query)
+
+            rows = cur.fetchall()
+            mismatches = []
+            for row in rows:
+               mismatches.append(
+                   {
+                       "member_id": row[0],
+                       "expected_count": row[1],
+                       "expected_total": row[2],
+                       "stored_count": row[3],
+                       "stored_total": row[4]
+                   }
+               )
+
+            return mismatches
     except Exception as e:
         log.critical(e)
 
-def update_read_notification(id):
-    """
-        Updates member first name by the first_name provided where the key is username.
-    """
-    try:
-        cur = conn.cursor()
-
-        query = """
-            UPDATE notifications
-            SET is_read = true
-            WHERE id = %s
-        """
+MEMBER_ORDERS_QUERY = """
+    WITH member_information (id)
+    AS
+    (
+        SELECT id FROM members WHERE username = %s
+    )
+    SELECT o.id, oc.category_name, o.price, o.product_title, o.product_image, os.status_name, o.product_short_description
+    FROM orders o
+    INNER JOIN member_information mi ON mi.id = o.member_id
+    INNER JOIN order_category oc ON o.order_category = oc.id
+    INNER JOIN order_status os ON o.product_order_status = os.id
+    WHERE (%s IS NULL OR o.id < %s)
+    ORDER BY o.id DESC
+    LIMIT %s
+"""
+
+def order_data(row):
+    return {
+        "id": row[0],
+        "category_name": row[1],
+        "price": None if row[2] is None else str(row[2]),
+        "product_title": row[3],
+        "product_image": row[4],
+        "status_name": row[5],
+        "product_short_description": row[6]
+    }
+
+def iter_member_orders(username, before=None, limit=None, itersize=None):
+    """
+        Yield member orders newest first, read through a server side cursor.
+
+        Orders are paged by keyset on order id, the next page starts before the id of the last order of the previous
+        one. Only itersize rows are held in memory at a time no matter how many orders the member has. The
+        connection stays checked out until the generator is exhausted or closed.
 
-        cur.execute(query, (id,))
-        conn.commit()
+        Args:
+            username: members username, string type
+            before: only orders with id lower than before, None to start with the newest order
+            limit: maximum number of orders, None for all of them
+            itersize: rows fetched from the server at a time, ORDERS_FETCH_SIZE by default
 
-        cur.close()
+        Returns:
+            Generator of order dicts, errors are logged and raised since part of the orders may be sent already
+    """
+    started = time.perf_counter()
+    timed = False
+    try:
+        with pool.transaction(name="member_orders", itersize=itersize or env.int("ORDERS_FETCH_SIZE", 200)) as cur:
+            cur.execute(MEMBER_ORDERS_QUERY, (username, before, before, limit))
+
+            for row in cur:
+                if not timed:
+                    # Query time ends with the first batch of rows, the rest is paced by the client reading the response
+                    registry.observe("pelbox_db_query_seconds", time.perf_counter() - started, {"query": "iter_member_orders"})
+                    timed = True
+                yield order_data(row)
     except Exception as e:
         log.critical(e)
+        raise
+    finally:
+        if not timed:
+            registry.observe("pelbox_db_query_seconds", time.perf_counter() - started, {"query": "iter_member_orders"})
 
-def get_organization_orders(organization_id):
+@timed_query
+def get_all_member_orders(username):
     """
-        Return all orders that organization needs to deliver
+        Return all member orders
     """
     try:
-        query = """
-            SELECT o.id, od.id, o.product_title, o.price, md.city, md.city_address, od.created_at, o.product_image, od.courier_id
-            FROM orders o
-            INNER JOIN organization_deliveries od ON o.id = od.order_id
-            INNER JOIN member_details md ON o.member_id = md.member_id 
-            WHERE od.organization_id = %s AND od.is_delivered = false
-        """
-
-        cur = conn.cursor()
-        cur.execute(query, (organization_id,))
-        
-        rows = cur.fetchall()
-        orders = []
-        for row in rows:
-           orders.append(
-               {
-                   "order_id": row[0],
-                   "organization_delivery_id": row[1],
-                   "product_title": row[2],
-                   "price": row[3],
-                   "city": row[4],
-                   "city_address": row[5],
-                   "created_at": row[6],
-                   "product_image": row[7],
-                   "courier_id": row[8]
-               }
-           ) 
-
-        cur.close()
-        return orders
+        return list(iter_member_orders(username))
     except Exception as e:
         log.critical(e)
 
-def get_organization_deliveries(organization_id, username):
+def get_unread_notifications(username):
     """
-        Return all deliveries assigned to member
+        Return all unread member notifications
+    """
+    page = get_notifications_since(username)
+    if page is not None:
+        return page[0]
+
+@timed_query
+def get_notifications_since(username, since=None, limit=None, settle=None):
+    """
+        Return unread member notifications with id above the since cursor, oldest first.
+
+        Ids are taken when a notification is inserted, not when it commits, so a notification with a lower id can
+        become visible after a higher one was already synced. The cursor therefore only moves past notifications
+        created more than settle seconds ago. Newer ones are returned again on the next call and clients drop ids
+        they already have. A notification whose inserting transaction stays open longer than settle seconds can still
+        be skipped. Uses the partial index on unread notifications per member.
+
+        Args:
+            username: members username, string type
+            since: cursor returned by the previous call, None for all unread notifications
+            limit: maximum number of notifications, None for all of them
+            settle: seconds after creation a notification is considered committed, NOTIFICATIONS_SETTLE_SECONDS by default
+
+        Returns:
+            (notifications, cursor) where cursor is the id to pass as since next time, None on error
     """
+    if settle is None:
+        settle = env.float("NOTIFICATIONS_SETTLE_SECONDS", 5)
+
     try:
-        query = """
-            SELECT o.id, od.id, o.product_title, o.price, md.city, md.city_address, od.created_at, o.product_image, od.courier_id
-            FROM orders o
-            INNER JOIN organization_deliveries od ON o.id = od.order_id
-            INNER JOIN member_details md ON o.member_id = md.member_id 
-            WHERE od.organization_id = %s AND od.is_delivered = false AND od.courier_id = (SELECT id FROM members WHERE username = %s)
-        """
-
-        cur = conn.cursor()
-        cur.execute(query, (organization_id, username))
-        
-        rows = cur.fetchall()
-        deliveries = []
-        for row in rows:
-           deliveries.append(
-               {
-                   "order_id": row[0],
-                   "organization_delivery_id": row[1],
-                   "product_title": row[2],
-                   "price": row[3],
-                   "city": row[4],
-                   "city_address": row[5],
-                   "created_at": row[6],
-                   "product_image": row[7],
-                   "courier_id": row[8]
-               }
-           ) 
-
-        cur.close()
-        return deliveries
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                SELECT n.id, n.notification_title, n.notification_text, n.notification_image_url, n.created_at,
+                       n.created_at < now() - %s * interval '1 second'
+                FROM notifications n
+                INNER JOIN member_information mi ON mi.id = n.member_id
+                WHERE n.is_read = false AND (%s IS NULL OR n.id > %s)
+                ORDER BY n.id
+                LIMIT %s
+            """
+
+            cur.execute(query, (username, settle, since, since, limit))
+
+            rows = cur.fetchall()
+            notifications = []
+            cursor = since
+            settled = True
+            for row in rows:
+               notifications.append(
+                   {
+                       "id": row[0],
+                       "notification_title": row[1],
+                       "notification_text": row[2],
+                       "notification_image_url": row[3],
+                       "created_at": row[4]
+                   }
+               )
+               # Cursor stops before the first notification that may still have lower ids committing behind it
+               settled = settled and bool(row[5])
+               if settled:
+                   cursor = row[0]
+
+            return notifications, cursor
     except Exception as e:
         log.critical(e)
 
-def take_order_delivery(username, order_id):
+@timed_query
+def mark_notifications_read(username, ids=None, up_to=None):
     """
-        Updates courier delivery by given order id
+        Mark member notifications read in one statement.
+
+        Only notifications of the member are touched, ids of other members' notifications are ignored.
+
+        Args:
+            username: members username, string type
+            ids: list of notification ids to mark read
+            up_to: mark read every notification with id up to and including up_to, used when ids is None
+
+        Returns:
+            Number of notifications marked read, None on error
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            WITH member_information (id)
-            AS 
-            (
-                SELECT id FROM members WHERE username = %s
-            )
-            UPDATE organization_deliveries od
-            SET courier_id = member_information.id
-            FROM member_information 
-            WHERE od.order_id = %s
-        """
-
-        cur.execute(query, (username, order_id))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                UPDATE notifications n
+                SET is_read = true
+                FROM members m
+                WHERE m.id = n.member_id
+                  AND m.username = %s
+                  AND n.is_read = false
+                  AND {condition}
+            """
+
+            if ids is not None:
+                cur.execute(query.format(condition="n.id = ANY(%s)"), (username, list(ids)))
+            else:
+                cur.execute(query.format(condition="n.id <= %s"), (username, up_to))
+
+            return cur.rowcount
     except Exception as e:
         log.critical(e)
 
-def leave_order_delivery(order_id):
+@timed_query
+def update_read_notification(id):
     """
-        Updates courier delivery by given order id to null
+        Updates member first name by the first_name provided where the key is username.
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            UPDATE organization_deliveries od
-            SET courier_id = null
-            WHERE od.order_id = %s
-        """
-
-        cur.execute(query, (order_id,))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                UPDATE notifications
+                SET is_read = true
+                WHERE id = %s
+            """
+
+            cur.execute(query, (id,))
     except Exception as e:
         log.critical(e)
 
-def update_security_key(security_key, member_id):
+@timed_query
+def get_organization_orders(organization_id):
     """
-        Updates security for the pelbox provided by the member id
+        Return all orders that organization needs to deliver
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            UPDATE rpi_devices
-            SET user_security_key = %s 
-            WHERE member_id = %s
-        """
-
-        cur.execute(query, (security_key, member_id))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                SELECT o.id, od.id, o.product_title, o.price, md.city, md.city_address, od.created_at, o.product_image, od.courier_id
+                FROM orders o
+                INNER JOIN organization_deliveries od ON o.id = od.order_id
+                INNER JOIN member_details md ON o.member_id = md.member_id 
+                WHERE od.organization_id = %s AND od.is_delivered = false
+            """
+
+            cur.execute(query, (organization_id,))
+
+            rows = cur.fetchall()
+            orders = []
+            for row in rows:
+               orders.append(
+                   {
+                       "order_id": row[0],
+                       "organization_delivery_id": row[1],
+                       "product_title": row[2],
+                       "price": row[3],
+                       "city": row[4],
+                       "city_address": row[5],
+                       "created_at": row[6],
+                       "product_image": row[7],
+                       "courier_id": row[8]
+                   }
+               ) 
+
+            return orders
     except Exception as e:
         log.critical(e)
 
-def set_box_connected(security_key, member_id, status):
+@timed_query
+def get_organization_deliveries(organization_id, username):
     """
-        Set that box is connected
+        Return all deliveries assigned to member
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            UPDATE rpi_devices
-            SET connected = %s
-            WHERE security_key = %s AND member_id = %s
-        """
-
-        cur.execute(query, (status, security_key, member_id,))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                SELECT o.id, od.id, o.product_title, o.price, md.city, md.city_address, od.created_at, o.product_image, od.courier_id
+                FROM orders o
+                INNER JOIN organization_deliveries od ON o.id = od.order_id
+                INNER JOIN member_details md ON o.member_id = md.member_id 
+                WHERE od.organization_id = %s AND od.is_delivered = false AND od.courier_id = (SELECT id FROM members WHERE username = %s)
+            """
+
+            cur.execute(query, (organization_id, username))
+
+            rows = cur.fetchall()
+            deliveries = []
+            for row in rows:
+               deliveries.append(
+                   {
+                       "order_id": row[0],
+                       "organization_delivery_id": row[1],
+                       "product_title": row[2],
+                       "price": row[3],
+                       "city": row[4],
+                       "city_address": row[5],
+                       "created_at": row[6],
+                       "product_image": row[7],
+                       "courier_id": row[8]
+                   }
+               ) 
+
+            return deliveries
     except Exception as e:
         log.critical(e)
 
-def update_locking(member_id, state):
+@timed_query
+def take_order_delivery(username, order_id):
     """
-        Update box locking
+        Updates courier delivery by given order id
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            UPDATE box_locking
-            SET locked = %s
-            WHERE member_id = %s
-        """
-
-        cur.execute(query, (state, member_id,))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                WITH member_information (id)
+                AS 
+                (
+                    SELECT id FROM members WHERE username = %s
+                )
+                UPDATE organization_deliveries od
+                SET courier_id = member_information.id
+                FROM member_information 
+                WHERE od.order_id = %s
+            """
+
+            cur.execute(query, (username, order_id))
     except Exception as e:
         log.critical(e)
 
-def update_dismantle(member_id, state):
+@timed_query
+def leave_order_delivery(order_id):
     """
-        Update box dismantle
+        Updates courier delivery by given order id to null
     """
     try:
-        cur = conn.cursor()
-
-        query = """
-            UPDATE box_locking
-            SET dismantle = %s
-            WHERE member_id = %s
-        """
-
-        cur.execute(query, (state, member_id,))
-        conn.commit()
-
-        cur.close()
+        with pool.transaction() as cur:
+            query = """
+                UPDATE organization_deliveries od
+                SET courier_id = null
+                WHERE od.order_id = %s
+            """
+
+            cur.execute(query, (order_id,))
     except Exception as e:
         log.critical(e)
 
-def update_expanding_value(member_id, expanding_value):
+@timed_query
+def update_security_key(security_key, member_id):
     """
-        Update box expanding_value
+        Updates security for the pelbox provided by the member id
     """
     try:
-        cur = conn.cursor()
+        with pool.transaction() as cur:
+            query = """
+                UPDATE rpi_devices
+                SET user_security_key = %s 
+                WHERE member_id = %s
+            """
+
+            cur.execute(query, (security_key, member_id))
+    except Exception as e:
+        log.critical(e)
+
+BOX_LOCKING_COLUMNS = ("locked", "dismantle", "expanding_value", "door_open")
 
-        query = """
-            UPDATE box_locking
-            SET expanding_value = %s
-            WHERE member_id = %s
-        """
+@timed_query
+def update_box_state(member_id, changes, security_key=None):
+    """
+        Update box state columns of the member box in one transaction.
 
-        cur.execute(query, (expanding_value, member_id,))
-        conn.commit()
+        changes maps box_locking columns and connected to new values. All box_locking columns are written with
+        one UPDATE and connected is written to rpi_devices where security key matches.
+        Rows are only updated when a value differs so writing the same state doesn't create new row versions.
+        Updated fields are sent on the box_state channel with NOTIFY, delivered to listeners once the transaction commits.
 
-        cur.close()
+        Returns:
+            True if any row was updated, False if state was already the same
+    """
+    try:
+        with pool.transaction() as cur:
+            updated = {}
+
+            columns = [column for column in BOX_LOCKING_COLUMNS if column in changes]
+            if columns:
+                assignments = ", ".join(f"{column} = %s" for column in columns)
+                differences = " OR ".join(f"{column} IS DISTINCT FROM %s" for column in columns)
+                query = f"""
+                    UPDATE box_locking
+                    SET {assignments}
+                    WHERE member_id = %s AND ({differences})
+                """
+
+                values = [changes[column] for column in columns]
+                cur.execute(query, (*values, member_id, *values))
+                if cur.rowcount:
+                    updated.update({column: changes[column] for column in columns})
+
+            if "connected" in changes:
+                query = """
+                    UPDATE rpi_devices
+                    SET connected = %s
+                    WHERE security_key = %s AND member_id = %s AND connected IS DISTINCT FROM %s
+                """
+
+                cur.execute(query, (changes["connected"], security_key, member_id, changes["connected"]))
+                if cur.rowcount:
+                    updated["connected"] = changes["connected"]
+
+            if updated:
+                cur.execute("SELECT pg_notify('box_state', %s)", (sjson.dumps({"member_id": member_id, "changes": updated}),))
+
+            return len(updated) > 0
     except Exception as e:
         log.critical(e)
 
-def update_door_status(member_id, door_open):
-    """
-        Update box door_open
+def write_box_state(member_id, changes, observed=None, security_key=None):
     """
-    try:
-        cur = conn.cursor()
+        Persist changed box state fields.
+
+        If observed PelBox holds the current state fields equal to it are dropped and nothing is sent to the
+        database when no field changed. Remaining fields are written together in one transaction.
 
-        query = """
-            UPDATE box_locking
-            SET door_open = %s
-            WHERE member_id = %s
-        """
+        Args:
+            member_id: id of the box owner
+            changes: dict of box state fields (locked, dismantle, expanding_value, door_open, connected)
+            observed: PelBox with the current state if already loaded
+            security_key: user security key, required when connected is written
+        Returns:
+            Dict of fields sent to the database
+    """
+    if observed is not None:
+        changes = {field: value for field, value in changes.items() if getattr(observed, field) != value}
 
-        cur.execute(query, (door_open, member_id,))
-        conn.commit()
+    if changes:
+        update_box_state(member_id, changes, security_key)
 
-        cur.close()
-    except Exception as e:
-        log.critical(e)
\ No newline at end of file
+    return changes
@@ -0,0 +1,471 @@
+"""
+    Hardware controller owning GPIO pins, motors and the actuator queue.
+
+    HardwareController drives the hardware in-process. Run as a daemon with python -m rpi.controller it serves the
+    same commands on a Unix domain socket, API processes then talk to it through ControllerClient and can be scaled
+    out while hardware jobs stay serialized in the single daemon process.
+
+    Frames on the socket are a 4 byte big endian payload length followed by compact JSON. Requests are
+    {"c": command, "a": arguments}, replies are {"ok": true, "r": result} or {"ok": false, "e": error}.
+"""
+import os
+import json
+import select
+import signal
+import socket
+import struct
+import logging
+import threading
+import socketserver
+
+from environs import Env
+
+from rpi import common
+from rpi import hardware
+from rpi.metrics import registry
+from rpi.actuator import Actuator
+from rpi.motion import MotionPlanner
+from rpi.sequencer import Sequencer
+from rpi.pelbox_member import PelBox
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1024 * 1024
+
+class ControllerError(Exception):
+    pass
+
+def send_frame(sock, message):
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    sock.sendall(FRAME_HEADER.pack(len(payload)) + payload)
+
+def recv_exactly(sock, size):
+    """
+        Read exactly size bytes. Returns None if the peer closed the connection before sending anything.
+    """
+    chunks = []
+    received = 0
+    while received < size:
+        chunk = sock.recv(size - received)
+        if not chunk:
+            if received == 0:
+                return None
+            raise ConnectionError("Connection closed in the middle of a frame")
+        chunks.append(chunk)
+        received += len(chunk)
+    return b"".join(chunks)
+
+def recv_frame(sock):
+    """
+        Read one frame and return decoded message, or None if the peer closed the connection between frames.
+    """
+    header = recv_exactly(sock, FRAME_HEADER.size)
+    if header is None:
+        return None
+
+    size, = FRAME_HEADER.unpack(header)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes exceeds {MAX_FRAME_SIZE} bytes")
+
+    payload = recv_exactly(sock, size)
+    if payload is None:
+        raise ConnectionError("Connection closed in the middle of a frame")
+    return json.loads(payload.decode("utf-8"))
+
+class HardwareController:
+    COMMANDS = ("ping", "set_relay", "expand", "door", "batch", "job", "metrics")
+
+    def __init__(self, new_gpio, parallel_stages=False, history_size=256, start_timeout=10):
+        """
+            Owns GPIO pins, motors and motion state, hardware jobs run one after another on the actuator.
+
+            new_gpio returns the GPIO backend, it is called by start so pins are set up off the import path.
+            Jobs submitted before start finished wait for it up to start_timeout seconds and fail after that, relay
+            commands are refused until then.
+            Only one HardwareController may exist per Pi, the real GPIO backend enforces it with its ownership lock.
+        """
+        self.new_gpio = new_gpio
+        self.parallel_stages = parallel_stages
+        self.start_timeout = start_timeout
+        self.started = threading.Event()
+        self.start_lock = threading.Lock()
+
+        self.actuator = Actuator(history_size=history_size)
+        registry.register_callback(self.runtime_metrics)
+
+    @classmethod
+    def from_env(cls, env):
+        def new_gpio():
+            return hardware.new_backend(env.str("GPIO_BACKEND", "rpi"),
+                                        speedup=env.float("GPIO_SIM_SPEEDUP", 100),
+                                        lock_path=env.str("GPIO_LOCK_FILE", "/tmp/pelbox-gpio.lock"))
+
+        return cls(new_gpio,
+                   parallel_stages=env.bool("MOTORS_PARALLEL_STAGES", False),
+                   history_size=env.int("ACTUATOR_JOB_HISTORY", 256),
+                   start_timeout=2 * env.float("STARTUP_RETRY_INTERVAL", 5))
+
+    def start(self):
+        """
+            Set up GPIO pins and motors. Safe to call again after it succeeded.
+        """
+        with self.start_lock:
+            if self.started.is_set():
+                return True
+
+            gpio = self.new_gpio()
+            self.relay = 21
+            gpio.setup_output(18)
+            gpio.setup_output(5)
+
+            gpio.setup_output(self.relay)
+            gpio.output(self.relay, 0)
+
+            self.motor1 = hardware.Motor(gpio, 13, 6)
+            self.motor2 = hardware.Motor(gpio, 17, 27)
+            self.motor3 = hardware.Motor(gpio, 23, 24)
+
+            self.sequencer = Sequencer()
+            self.planner = MotionPlanner({"motor1": self.motor1, "motor2": self.motor2},
+                                         sequencer=self.sequencer,
+                                         parallel_stages=self.parallel_stages)
+            self.gpio = gpio
+            self.started.set()
+            return True
+
+    def wait_started(self):
+        """
+            Wait for start so a job doesn't block the actuator worker forever when hardware never comes up.
+        """
+        if not self.started.wait(self.start_timeout):
+            raise ControllerError("Hardware controller is not available, hardware did not start")
+
+    def runtime_metrics(self):
+        return [("pelbox_actuator_pending_jobs", {}, self.actuator.pending())]
+
+    def ping(self):
+        return True
+
+    def set_relay(self, on):
+        if not self.started.is_set():
+            raise ControllerError("Hardware is still starting")
+        self.gpio.output(self.relay, 1 if on else 0)
+        return True
+
+    def current_state(self, member_id):
+        """
+            Box state read when a job runs, jobs queued before it may have changed the box since the request came in.
+        """
+        row = common.get_pelbox_settings(member_id)
+        if row is None:
+            raise ControllerError(f"Box state of member {member_id} could not be read")
+        return PelBox.from_row(row)
+
+    def expand_box(self, member_id, expanding_value):
+        """
+            Move expanding motors to the expanding value and persist it. Runs on the actuator worker.
+        """
+        self.wait_started()
+        pelbox = self.current_state(member_id)
+        self.planner.sync(pelbox.expanding_value)
+        self.planner.move_to(expanding_value)
+
+        common.write_box_state(member_id, {"expanding_value": expanding_value}, observed=pelbox)
+
+    def move_door(self, member_id, door_status):
+        """
+            Open or close the door and persist door state. Runs on the actuator worker.
+        """
+        self.wait_started()
+        pelbox = self.current_state(member_id)
+        self.drive_door(door_status, pelbox.door_open)
+
+        common.write_box_state(member_id, {"door_open": True if door_status == "open" else False}, observed=pelbox)
+
+    def drive_door(self, door_status, door_open):
+        if door_status == "open" and door_open == False:
+            with self.sequencer.motor_lock("motor3"):
+                self.motor3.moveForward(100, 5)
+                self.gpio.clock.sleep(0.25)
+                self.motor3.stop()
+        elif door_status == "close" and door_open == True:
+            with self.sequencer.motor_lock("motor3"):
+                self.motor3.moveBackward(100, 5)
+                self.gpio.clock.sleep(0.25)
+                self.motor3.stop()
+
+    def batch_box(self, member_id, operations):
+        """
+            Run operations in order and persist resulting state with one write. Runs on the actuator worker.
+
+            Operations are {"op": name, "value": value} with the names of the single operation routes. When an
+            operation fails the rest are skipped, state changed by operations finished before it is still persisted.
+
+            Returns:
+                List of {"op", "status", "error"} per operation, status is done, failed or skipped
+        """
+        self.wait_started()
+        pelbox = self.current_state(member_id)
+        self.planner.sync(pelbox.expanding_value)
+
+        changes = {}
+        results = []
+        for operation in operations:
+            if results and results[-1]["status"] != "done":
+                results.append({"op": operation["op"], "status": "skipped", "error": None})
+                continue
+
+            try:
+                self.run_operation(operation, changes, pelbox)
+                results.append({"op": operation["op"], "status": "done", "error": None})
+            except Exception as e:
+                log.critical(f"Batch operation {operation['op']} failed: {e}")
+                results.append({"op": operation["op"], "status": "failed", "error": str(e)})
+
+        common.write_box_state(member_id, changes, observed=pelbox)
+        return results
+
+    def run_operation(self, operation, changes, pelbox):
+        op, value = operation["op"], operation["value"]
+        if op == "set_locking":
+            changes["locked"] = value
+        elif op == "set_dismantle":
+            self.set_relay(value)
+            changes["dismantle"] = value
+        elif op == "set_door_status":
+            self.drive_door(value, changes.get("door_open", pelbox.door_open))
+            changes["door_open"] = value == "open"
+        elif op == "set_expanding_value":
+            self.planner.move_to(value)
+            changes["expanding_value"] = value
+        else:
+            raise ValueError(f"Unknown operation {op}")
+
+    def expand(self, member_id, expanding_value):
+        job = self.actuator.submit("expanding_value", member_id, self.expand_box, member_id, expanding_value)
+        return job.json_data()
+
+    def door(self, member_id, door_status):
+        job = self.actuator.submit("door_status", member_id, self.move_door, member_id, door_status)
+        return job.json_data()
+
+    def batch(self, member_id, operations):
+        job = self.actuator.submit("batch", member_id, self.batch_box, member_id, operations)
+        return job.json_data()
+
+    def job(self, job_id, owner):
+        """
+            Returns job data, or None if the job is unknown or belongs to another member.
+        """
+        job = self.actuator.get(job_id)
+        if job is None or job.owner != owner:
+            return None
+        return job.json_data()
+
+    def metrics(self):
+        """
+            Metrics of the controller process. In-process controller shares the registry with the API, so there is nothing to add.
+        """
+        return ""
+
+    def handle(self, message):
+        """
+            Execute one framed request and return the reply message.
+        """
+        try:
+            command = message["c"]
+            if command not in self.COMMANDS:
+                return {"ok": False, "e": f"Unknown command {command}"}
+
+            if command == "metrics":
+                return {"ok": True, "r": registry.render({"process": "controller"})}
+            return {"ok": True, "r": getattr(self, command)(**message.get("a", {}))}
+        except Exception as e:
+            log.critical(f"Controller command failed: {e}")
+            return {"ok": False, "e": str(e)}
+
+    def shutdown(self, timeout=None):
+        self.actuator.shutdown(timeout)
+
+class ControllerClient:
+    def __init__(self, socket_path, timeout=5):
+        """
+            Client of the controller daemon with the same methods as HardwareController.
+
+            Each thread keeps its own connection open. A reused connection the daemon already closed, as happens after
+            the daemon restarted, is replaced before sending. A command is sent again on a new connection only when
+            sending it on a reused connection failed, so the daemon never got it. Once a command was sent it is never
+            repeated, even if the reply doesn't arrive, because expand, door and batch would run twice.
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        sock = getattr(self.local, "sock", None)
+        if sock is not None and select.select([sock], [], [], 0)[0]:
+            # Nothing is expected between commands, a readable idle connection was closed by the daemon
+            self.disconnect()
+            sock = None
+
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError as e:
+                sock.close()
+                raise ControllerError(f"Hardware controller is not reachable on {self.socket_path}: {e}")
+            self.local.sock = sock
+            self.local.reused = False
+        else:
+            self.local.reused = True
+        return sock
+
+    def disconnect(self):
+        sock = getattr(self.local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
+
+    def send(self, message):
+        """
+            Send message and return the connection it was sent on.
+        """
+        sock = self.connection()
+        try:
+            send_frame(sock, message)
+            return sock
+        except OSError as e:
+            self.disconnect()
+            if not self.local.reused:
+                raise ControllerError(f"Hardware controller command {message['c']} failed: {e}")
+
+        sock = self.connection()
+        try:
+            send_frame(sock, message)
+            return sock
+        except OSError as e:
+            self.disconnect()
+            raise ControllerError(f"Hardware controller command {message['c']} failed: {e}")
+
+    def call(self, command, **args):
+        sock = self.send({"c": command, "a": args})
+        try:
+            reply = recv_frame(sock)
+        except (OSError, ValueError) as e:
+            self.disconnect()
+            raise ControllerError(f"Hardware controller command {command} failed: {e}")
+
+        if reply is None:
+            self.disconnect()
+            raise ControllerError(f"Hardware controller closed connection during command {command}")
+
+        if not reply["ok"]:
+            raise ControllerError(reply["e"])
+        return reply["r"]
+
+    def start(self):
+        """
+            Check the daemon is reachable, used as startup task.
+        """
+        return self.ping()
+
+    def ping(self):
+        return self.call("ping")
+
+    def set_relay(self, on):
+        return self.call("set_relay", on=on)
+
+    def expand(self, member_id, expanding_value):
+        return self.call("expand", member_id=member_id, expanding_value=expanding_value)
+
+    def door(self, member_id, door_status):
+        return self.call("door", member_id=member_id, door_status=door_status)
+
+    def batch(self, member_id, operations):
+        return self.call("batch", member_id=member_id, operations=operations)
+
+    def job(self, job_id, owner):
+        return self.call("job", job_id=job_id, owner=owner)
+
+    def metrics(self):
+        try:
+            return self.call("metrics")
+        except ControllerError as e:
+            log.critical(e)
+            return ""
+
+    def shutdown(self, timeout=None):
+        self.disconnect()
+
+def new_controller(env):
+    """
+        Returns controller selected by HARDWARE_CONTROLLER, local drives GPIO in this process, socket talks to the daemon.
+    """
+    mode = env.str("HARDWARE_CONTROLLER", "local")
+    if mode == "local":
+        return HardwareController.from_env(env)
+    if mode == "socket":
+        return ControllerClient(env.str("CONTROLLER_SOCKET", "/tmp/pelbox-controller.sock"),
+                                timeout=env.float("CONTROLLER_TIMEOUT", 5))
+    raise ValueError(f"Unknown hardware controller {mode}")
+
+class ControllerRequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                message = recv_frame(self.request)
+                if message is None:
+                    return
+                send_frame(self.request, self.server.controller.handle(message))
+            except (OSError, ValueError) as e:
+                log.warning(f"Dropping controller client connection: {e}")
+                return
+
+class ControllerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, controller):
+        """
+            Unix socket server handing framed requests to the controller, one thread per client connection.
+
+            Socket left behind by a previous daemon is removed, only the process holding the GPIO lock gets this far.
+        """
+        self.controller = controller
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, ControllerRequestHandler)
+        os.chmod(socket_path, 0o660)
+
+def stop(signum, frame):
+    raise SystemExit(0)
+
+def main():
+    env = Env()
+    env.read_env()
+
+    socket_path = env.str("CONTROLLER_SOCKET", "/tmp/pelbox-controller.sock")
+    controller = HardwareController.from_env(env)
+    controller.start()
+    server = ControllerServer(socket_path, controller)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    log.info(f"Hardware controller listening on {socket_path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        log.info("Controller stopped. Waiting for queued hardware jobs to finish")
+        controller.shutdown(timeout=env.float("SERVER_DRAIN_TIMEOUT", 30))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import time
+import logging
+import threading
+import psycopg2
+import psycopg2.extensions
+
+from contextlib import contextmanager
+
+from rpi.metrics import registry
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+class ConnectionPool:
+    def __init__(self, minconn=1, maxconn=5, timeout=10, idle_check=30, **connect_kwargs):
+        """
+            Thread safe pool of PostgreSQL connections.
+
+            At most maxconn connections are open at the same time, callers wait up to timeout seconds for a free one.
+            Every checked out connection is checked for pending server errors and connections idle for more than
+            idle_check seconds are pinged with SELECT 1. Broken connections are replaced with new ones.
+        """
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self.connect_kwargs = connect_kwargs
+
+        self.idle = []
+        self.size = 0
+        self.prepared = {}
+        self.condition = threading.Condition()
+
+    def connect(self):
+        log.info(f"Connecting to {self.connect_kwargs.get('database')} database")
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def open(self):
+        """
+            Open minconn connections up front.
+        """
+        with self.condition:
+            while self.size < self.minconn:
+                self.idle.append((self.connect(), time.monotonic()))
+                self.size += 1
+        log.info(f"Connected to {self.connect_kwargs.get('database')} database")
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        with self.condition:
+            while True:
+                if self.idle:
+                    conn, last_used = self.idle.pop()
+                    break
+                if self.size < self.maxconn:
+                    conn, last_used = None, None
+                    self.size += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No database connection available in {self.timeout} seconds")
+                self.condition.wait(remaining)
+
+        if conn is not None and self.is_healthy(conn, last_used):
+            return conn
+
+        if conn is not None:
+            log.info("Database connection is broken. Reconnecting")
+            self.close(conn)
+
+        try:
+            return self.connect()
+        except Exception:
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+            raise
+
+    def putconn(self, conn, discard=False):
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                discard = True
+
+        if discard or conn.closed:
+            self.close(conn)
+            with self.condition:
+                self.size -= 1
+                self.condition.notify()
+        else:
+            with self.condition:
+                self.idle.append((conn, time.monotonic()))
+                self.condition.notify()
+
+    def is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        try:
+            conn.poll()
+            if time.monotonic() - last_used >= self.idle_check:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def close(self, conn):
+        self.prepared.pop(conn, None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def stats(self):
+        with self.condition:
+            return {"size": self.size, "idle": len(self.idle)}
+
+    def discard_idle(self):
+        """
+            Close all idle connections, used after connection loss when the rest of the pool is most likely broken too.
+        """
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.size -= len(idle)
+            self.condition.notify_all()
+
+        for conn, _ in idle:
+            self.close(conn)
+
+    @contextmanager
+    def transaction(self, name=None, itersize=None):
+        """
+            Yields cursor within transaction.
+
+            Transaction is committed when block finishes and rolled back if block raises. With name the cursor is a
+            server side named cursor, rows are fetched itersize at a time while iterating over it instead of all at
+            once on execute.
+        """
+        conn = self.getconn()
+        discard = False
+        try:
+            with conn.cursor(name) as cur:
+                if itersize is not None:
+                    cur.itersize = itersize
+                yield cur
+            conn.commit()
+            registry.inc("pelbox_db_commits_total")
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            registry.inc("pelbox_db_connection_errors_total")
+            discard = True
+            self.discard_idle()
+            raise
+        except Exception:
+            conn.rollback()
+            registry.inc("pelbox_db_rollbacks_total")
+            self.deallocate(conn)
+            raise
+        finally:
+            self.putconn(conn, discard)
+
+    def execute_prepared(self, cur, name, statement, params):
+        """
+            Execute server side prepared statement.
+
+            Statement is prepared once per connection on first use, later calls only send EXECUTE with parameters.
+            statement uses $1, $2... placeholders and name has to be unique for the statement.
+        """
+        prepared = self.prepared.setdefault(cur.connection, set())
+        if name not in prepared:
+            cur.execute(f"PREPARE {name} AS {statement}")
+            prepared.add(name)
+
+        placeholders = ", ".join(["%s"] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})", params)
+
+    def deallocate(self, conn):
+        """
+            Forget prepared statements of the connection after failed transaction, they are prepared again on next use.
+        """
+        if self.prepared.pop(conn, None):
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("DEALLOCATE ALL")
+                conn.commit()
+            except psycopg2.Error as e:
+                log.critical(e)
@@ -0,0 +1,163 @@
+import os
+import time
+import fcntl
+import logging
+import threading
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+class RealClock:
+    def now(self):
+        return time.monotonic()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+class VirtualClock:
+    def __init__(self, speedup=100):
+        """
+            Clock running speedup times faster than wall clock.
+
+            sleep waits only seconds / speedup of real time, now returns virtual seconds since clock creation.
+            Parallel sleeps overlap the same way they would in real time, so timings of concurrent motor
+            moves stay comparable.
+        """
+        self.speedup = speedup
+        self.started = time.monotonic()
+
+    def now(self):
+        return (time.monotonic() - self.started) * self.speedup
+
+    def sleep(self, seconds):
+        time.sleep(seconds / self.speedup)
+
+def claim_ownership(lock_path):
+    """
+        Take exclusive lock so only one process on the Pi drives the GPIO pins.
+
+        Lock is held for the life of the returned file object. Raises RuntimeError if another process holds it.
+    """
+    lock_file = open(lock_path, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        raise RuntimeError(f"GPIO pins are owned by another process, lock {lock_path} is taken")
+
+    lock_file.truncate(0)
+    lock_file.write(str(os.getpid()))
+    lock_file.flush()
+    return lock_file
+
+class RPiGPIOBackend:
+    def __init__(self, lock_path="/tmp/pelbox-gpio.lock"):
+        """
+            Backend driving real pins through RPi.GPIO in BCM numbering.
+
+            Creating the backend claims GPIO ownership, so a second process trying to drive the pins fails on start.
+        """
+        self.ownership = claim_ownership(lock_path)
+
+        import RPi.GPIO as GPIO
+
+        self.GPIO = GPIO
+        self.clock = RealClock()
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BCM)
+
+    def setup_output(self, pin):
+        self.GPIO.setup(pin, self.GPIO.OUT)
+
+    def output(self, pin, value):
+        self.GPIO.output(pin, self.GPIO.HIGH if value else self.GPIO.LOW)
+
+    def pwm(self, pin, frequency):
+        return self.GPIO.PWM(pin, frequency)
+
+class SimulatedPWM:
+    def __init__(self, backend, pin, frequency):
+        self.backend = backend
+        self.pin = pin
+        self.frequency = frequency
+        self.duty_cycle = None
+
+    def start(self, duty_cycle):
+        self.ChangeDutyCycle(duty_cycle)
+
+    def ChangeDutyCycle(self, duty_cycle):
+        self.duty_cycle = duty_cycle
+        self.backend.record(self.pin, "pwm", duty_cycle)
+
+class SimulatedGPIOBackend:
+    def __init__(self, clock=None):
+        """
+            In-process backend recording every pin and PWM change with virtual clock time.
+
+            transitions holds (time, pin, kind, value) tuples where kind is "setup", "output" or "pwm".
+        """
+        self.clock = clock or VirtualClock()
+        self.pins = {}
+        self.transitions = []
+        self.lock = threading.Lock()
+
+    def record(self, pin, kind, value):
+        with self.lock:
+            self.transitions.append((self.clock.now(), pin, kind, value))
+
+    def setup_output(self, pin):
+        self.pins[pin] = 0
+        self.record(pin, "setup", 0)
+
+    def output(self, pin, value):
+        self.pins[pin] = 1 if value else 0
+        self.record(pin, "output", self.pins[pin])
+
+    def pwm(self, pin, frequency):
+        return SimulatedPWM(self, pin, frequency)
+
+    def reset(self):
+        with self.lock:
+            self.transitions = []
+
+def new_backend(name="rpi", speedup=100, lock_path="/tmp/pelbox-gpio.lock"):
+    """
+        Returns GPIO backend by name, rpi for real pins or simulated for the in-process simulator.
+    """
+    if name == "rpi":
+        return RPiGPIOBackend(lock_path)
+    if name == "simulated":
+        log.info(f"Using simulated GPIO running {speedup} times faster than real time")
+        return SimulatedGPIOBackend(VirtualClock(speedup))
+    raise ValueError(f"Unknown GPIO backend {name}")
+
+class Motor():
+    def __init__(self, gpio, In1, In2):
+        self.gpio = gpio
+        self.In1 = In1
+        self.In2 = In2
+        gpio.setup_output(self.In1)
+        gpio.setup_output(self.In2)
+
+        self.pwm1 = gpio.pwm(self.In1, 100) # Apply full voltage to device
+        self.pwm2 = gpio.pwm(self.In2, 100) # Apply full voltage to device
+        self.pwm1.start(0) # start with motor off
+        self.pwm2.start(0) # start with motor off
+
+    def moveForward(self, speed, t=0): # 'speed' allows the user to input spee
+        self.gpio.output(self.In1, 0)
+        self.gpio.output(self.In2, 1)
+        self.pwm2.ChangeDutyCycle(speed)
+        self.gpio.clock.sleep(t)             # delay
+
+    def moveBackward(self, speed, t=0): # 'speed' allows the user to input spee
+        self.gpio.output(self.In1, 1)
+        self.gpio.output(self.In2, 0)
+        self.pwm1.ChangeDutyCycle(speed)
+        self.gpio.clock.sleep(t)             # delay
+
+    def stop(self):
+        self.pwm1.ChangeDutyCycle(0)
+        self.pwm2.ChangeDutyCycle(0)
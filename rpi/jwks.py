@@ -0,0 +1,64 @@
+import json
+import time
+import logging
+import threading
+
+from jwt.algorithms import RSAAlgorithm
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+class JWKSCache:
+    def __init__(self, url, http, timeout, min_refresh_interval=30):
+        """
+            Keeps the realm signing keys in memory.
+
+            Keys are fetched once from the realm certs endpoint and looked up by `kid`. An unknown `kid`
+            triggers a refresh so rotated keys are picked up, but refreshes are rate limited by
+            min_refresh_interval seconds so tokens with bogus `kid` can't be used to hammer Keycloak.
+        """
+        self.url = url
+        self.http = http
+        self.timeout = timeout
+        self.min_refresh_interval = min_refresh_interval
+        self.keys = {}
+        self.last_refresh = None
+        self.lock = threading.Lock()
+
+    def get_key(self, kid):
+        """
+            Returns public key for the given kid.
+
+            If key is not cached the key set is refreshed once. Returns None if the realm doesn't know the kid.
+        """
+        key = self.keys.get(kid)
+        if key is None:
+            self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+    def refresh(self, force=False):
+        """
+            Fetch signing keys from Keycloak and replace the cached key set.
+
+            Raises requests.exceptions.RequestException if Keycloak can't be reached.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.last_refresh is not None and now - self.last_refresh < self.min_refresh_interval:
+                return
+
+            # Attempt counts for the rate limit even if it fails, unknown kids must not hammer Keycloak while it is down
+            self.last_refresh = now
+            response = self.http.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+
+            keys = {}
+            for jwk in json.loads(response.text.encode("utf8"))["keys"]:
+                if jwk.get("kty") == "RSA" and jwk.get("use", "sig") == "sig":
+                    keys[jwk["kid"]] = RSAAlgorithm.from_jwk(json.dumps(jwk))
+
+            self.keys = keys
+            log.info(f"Loaded {len(keys)} signing keys from Keycloak")
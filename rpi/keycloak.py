@@ -3,24 +3,50 @@ import requests
 import logging
 import jwt
 
+from rpi import transport
+from rpi.metrics import timed_phase
+from rpi.jwks import JWKSCache
+from rpi.admin_token import AdminTokenManager
+from rpi.session_cache import SessionCache
+
 logging.basicConfig()
 log = logging.getLogger()
 logging.root.setLevel(logging.NOTSET)
 logging.basicConfig(level=logging.NOTSET)
 
 class Keycloak:
-    def __init__(self, admin_client_secret, member_client_secret, host):
-        self.access_token = None
-        self.refresh_token = None
+    def __init__(self, admin_client_secret, member_client_secret, host, local_verify=False, audience=None, issuer=None, admin_token_margin=30, session_cache=None, http=None, timeout=(3, 10)):
+        self.admin_tokens = AdminTokenManager(self.admin_log_in, self.refresh_admin_tokens, refresh_margin=admin_token_margin)
         self.admin_client_secret = admin_client_secret
         self.member_client_secret = member_client_secret
         self.host = host
 
-        self.admin_log_in()
+        self.local_verify = local_verify
+        self.audience = audience
+        self.issuer = issuer or f"http://{self.host}/auth/realms/pelbox"
+        self.http = http or transport.new_session()
+        self.timeout = timeout
+        self.session_cache = session_cache or SessionCache()
+        self.jwks = JWKSCache(f"http://{self.host}/auth/realms/pelbox/protocol/openid-connect/certs", self.http, self.timeout)
+        if self.local_verify and self.audience is None:
+            log.warning("Keycloak local token verification is enabled without audience, aud claim won't be checked")
+
+    def start(self):
+        """
+            Log in as admin-cli and load signing keys when tokens are verified locally.
+
+            Called during startup. Admin requests made before it finished log in on demand.
+        """
+        if not self.admin_log_in():
+            return False
+
+        if self.local_verify:
+            self.jwks.refresh(force=True)
+        return True
 
     def admin_log_in(self):
         """
-            Performs admin login on object instantiation.
+            Performs admin login.
 
             If login is successfull it will set access and refresh token.
         """
@@ -29,34 +55,56 @@ class Keycloak:
         headers = {
             "Content-Type": "application/x-www-form-urlencoded"
         }
-        response = requests.post(url, headers=headers, data=payload)
+        try:
+            response = self.http.post(url, headers=headers, data=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            log.critical(e)
+            return False
 
         if response.status_code == 200:
             log.info("Successfully logged in to keycloak as admin-cli")
             response_json = json.loads(response.text.encode("utf8"))
 
-            self.access_token = response_json["access_token"]
-            self.refresh_token = response_json["refresh_token"]
+            self.admin_tokens.set_tokens(response_json["access_token"], response_json.get("refresh_token"))
+            return True
         else:
             log.critical("There is a problem logging to Keycloak as admin-cli")
+            return False
+
+    @property
+    def access_token(self):
+        return self.admin_tokens.access_token
+
+    @property
+    def refresh_token(self):
+        return self.admin_tokens.refresh_token
 
     def verify_admin_token(self):
         """
             Verify is the access token valid.
 
-            If the access token is not valid it will use refresh token to get new access token.
+            Validity is read from the token exp claim. Tokens are normally renewed in the background before
+            they expire, this only renews them here if that didn't happen in time.
         """
-        url = f"http://{self.host}/auth/admin/realms/pelbox/users?username=test&enabled=true"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}"
-        }
+        self.admin_tokens.ensure_valid()
+
+    def admin_request(self, method, url, **kwargs):
+        """
+            Perform request against Keycloak admin API with the admin access token.
+
+            If Keycloak rejects the token with 401 new admin login is performed and the request is sent once more.
+            Raises requests.exceptions.RequestException if Keycloak can't be reached.
+        """
+        self.verify_admin_token()
 
-        response = requests.get(url, headers=headers)
+        headers = kwargs.pop("headers", {})
+        access_token = self.access_token
+        response = self.http.request(method, url, headers={**headers, "Authorization": f"Bearer {access_token}"}, timeout=self.timeout, **kwargs)
         if response.status_code == 401:
-            log.info("Keycloak admin token not valid. Refreshing")
-            self.refresh_admin_tokens()
-        else:
-            log.info("Keycloak admin token valid.")
+            self.admin_tokens.reject(access_token)
+            response = self.http.request(method, url, headers={**headers, "Authorization": f"Bearer {self.access_token}"}, timeout=self.timeout, **kwargs)
+
+        return response
 
     def refresh_admin_tokens(self):
         """
@@ -67,18 +115,23 @@ class Keycloak:
         headers = {
             "Content-Type": "application/x-www-form-urlencoded"
         }
-        response = requests.post(url, headers=headers, data=payload)
+        try:
+            response = self.http.post(url, headers=headers, data=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            log.critical(e)
+            return False
 
         if response.status_code == 200:
             response_json = json.loads(response.text.encode("utf8"))
-            self.access_token = response_json["access_token"]
-            self.refresh_token = response_json["refresh_token"]
+            self.admin_tokens.set_tokens(response_json["access_token"], response_json.get("refresh_token"))
+            return True
         elif response.status_code == 400:
             log.critical("Token is not active. New admin login.")
-            self.admin_log_in()
+            return self.admin_log_in()
         else:
             log.critical("Can't get new acccess and refresh token.")
             log.critical(json.loads(response.text.encode("utf8")))
+            return False
 
 
     def register(self, member):
@@ -88,8 +141,6 @@ class Keycloak:
             Based on the member object of type Member define payload with the appropriate values and perform insert
             on the /users endpoint within the realm.
         """
-        self.verify_admin_token()
-
         url = f"http://{self.host}/auth/admin/realms/pelbox/users"
         payload = {
             "email": member.email,
@@ -105,11 +156,15 @@ class Keycloak:
         }
 
         headers = {
-            "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json"
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        try:
+            response = self.admin_request("post", url, headers=headers, json=payload)
+        except requests.exceptions.RequestException as e:
+            log.critical(e)
+            return False
+
         if response.status_code == 201:
             log.info("Member is successfully register within keycloak.")
             return True
@@ -130,7 +185,12 @@ class Keycloak:
             "Content-Type": "application/x-www-form-urlencoded"
         }
 
-        response = requests.post(url, headers=headers, data=payload)
+        try:
+            response = self.http.post(url, headers=headers, data=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            log.critical(e)
+            return {"success": False, "message": "Keycloak is not reachable"}
+
         response_json = json.loads(response.text.encode("utf8"))
 
         if response.status_code == 200:
@@ -140,30 +200,119 @@ class Keycloak:
         if "error" in response_json:
             return {"success": False, "message": response_json["error_description"]}
 
+    def member_logout(self, refresh_token):
+        """
+            Logout member within keycloak.
+
+            Ends member session using member refresh token and drops cached session checks of that member.
+        """
+        url = f"http://{self.host}/auth/realms/pelbox/protocol/openid-connect/logout"
+        payload = f"client_id=pelbox-users&client_secret={self.member_client_secret}&refresh_token={refresh_token}"
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        try:
+            self.session_cache.invalidate(jwt.decode(refresh_token, verify=False)["sub"])
+        except (jwt.exceptions.DecodeError, KeyError) as e:
+            log.critical(e)
+
+        try:
+            response = self.http.post(url, headers=headers, data=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            log.critical(e)
+            return False
+
+        if response.status_code == 204:
+            return True
+
+        log.critical("There is an error with member logout within keycloak")
+        log.critical(response.text.encode("utf8"))
+        return False
+
+    def verify_member_token(self, access_token):
+        """
+            Verify member access token locally.
+
+            Checks signature against the cached realm keys together with exp, aud and iss claims.
+
+            Returns:
+                Token claims if the token is valid.
+            Raises:
+                jwt.exceptions.InvalidTokenError if the token is not valid
+                requests.exceptions.RequestException if signing keys can't be fetched
+        """
+        kid = jwt.get_unverified_header(access_token).get("kid")
+        key = self.jwks.get_key(kid)
+        if key is None:
+            raise jwt.exceptions.InvalidTokenError(f"Unknown signing key {kid}")
+
+        options = {"verify_aud": self.audience is not None}
+        return jwt.decode(access_token, key, algorithms=["RS256"], audience=self.audience, issuer=self.issuer, options=options)
+
     def is_member_logged(self, access_token):
         """
             Check is member logged in.
 
             Based on the id provided from the URI into this function verify member session.
+            With local_verify enabled the token is verified in-process and Keycloak is only contacted to
+            fetch signing keys, so sessions ended before token expiry are not detected.
 
             Args:
                 id: member id within application
             Returns:
                 If session is present it will return true, otherwise false
         """
-        self.verify_admin_token()
-        
+        claims, logged_in, status_code = self.member_session(access_token)
+        return logged_in, status_code
+
+    @timed_phase("auth")
+    def member_session(self, access_token):
+        """
+            Same check as is_member_logged, token is decoded only once and its claims are returned as well.
+
+            Returns:
+                (claims, logged_in, status_code), claims are None if the token can't be decoded or is not valid
+        """
+        if self.local_verify:
+            try:
+                claims = self.verify_member_token(access_token)
+                return claims, True, 200
+            except jwt.exceptions.InvalidSignatureError as e:
+                # Subclass of DecodeError, a token signed with another key is well formed but not valid
+                log.info(f"Member token rejected: {e}")
+                return None, False, 200
+            except jwt.exceptions.DecodeError as e:
+                log.critical(e)
+                return None, False, 500
+            except jwt.exceptions.InvalidTokenError as e:
+                log.info(f"Member token rejected: {e}")
+                return None, False, 200
+            except requests.exceptions.RequestException as e:
+                log.critical(e)
+                return None, False, 500
+
         try:
-            id = jwt.decode(access_token, verify=False)["sub"]
+            claims = jwt.decode(access_token, verify=False)
+            id = claims["sub"]
         except jwt.exceptions.DecodeError as e:
             log.critical(e)
-            return False, 500
+            return None, False, 500
 
+        logged_in, status_code = self.session_cache.get((id, claims.get("jti")), lambda: self.has_sessions(id))
+        return claims, logged_in, status_code
+
+    def has_sessions(self, id):
+        """
+            Check does member with the keycloak id have any active session.
+        """
         url = f"http://{self.host}/auth/admin/realms/pelbox/users/{id}/sessions"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}"
-        }
-        response = requests.get(url, headers=headers)
+        try:
+            response = self.admin_request("get", url)
+        except requests.exceptions.RequestException as e:
+            log.critical(e)
+            return False, 500
+
         if response.status_code == 200:
             response_json = json.loads(response.text.encode("utf8"))
             if len(response_json) >= 1:
@@ -174,14 +323,13 @@ class Keycloak:
             return False, 500
 
     def get_member_id(self, username):
-        self.verify_admin_token()
-
         url = f"http://{self.host}/auth/admin/realms/pelbox/users?username={username}"
-        headers = {
-            "Authorization": f"Bearer {self.access_token}"
-        }
+        try:
+            response = self.admin_request("get", url)
+        except requests.exceptions.RequestException as e:
+            log.critical(e)
+            return None
 
-        response = requests.get(url, headers=headers)
         if response.status_code == 200:
             response_json = json.loads(response.text.encode("utf8"))
             id = response_json[0]["id"]
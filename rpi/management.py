@@ -1,28 +1,28 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, request, stream_with_context
 from environs import Env
 import logging
-import psycopg2
-import json
-import jwt
+import hashlib
+import queue
 import time
+import threading
 
-import RPi.GPIO as GPIO
+from functools import wraps
 
-from rpi.member import Member
 from rpi.pelbox_member import PelBox
 
 from rpi import common
+from rpi.box_events import BoxEventBus, BoxStateListener, RESYNC
+from rpi.state_cache import BoxStateCache
+from rpi.order_aggregates import OrderAggregateCache
+from rpi import transport
+from rpi import metrics
+from rpi import responses
+from rpi.controller import new_controller
+from rpi.motion import EXPANDING_CALIBRATION
 from rpi.keycloak import Keycloak
-
-relay = 21
-GPIO.setwarnings(False)
-GPIO.setmode(GPIO.BCM)
-
-GPIO.setup(18, GPIO.OUT)
-GPIO.setup(5, GPIO.OUT)
-
-GPIO.setup(relay,GPIO.OUT)
-GPIO.output(relay , 0)
+from rpi.session_cache import SessionCache
+from rpi.startup import Startup
+from rpi.pipeline import MemberPipeline
 
 logging.basicConfig()
 log = logging.getLogger()
@@ -34,286 +34,450 @@ management = Blueprint("management", __name__)
 env = Env()
 env.read_env()
 
-class Motor():
-    def __init__(self, In1, In2):
-        self.In1 = In1
-        self.In2 = In2
-        GPIO.setup(self.In1,GPIO.OUT)
-        GPIO.setup(self.In2,GPIO.OUT)
-        
-        self.pwm1 = GPIO.PWM(self.In1, 100) # Apply full voltage to device
-        self.pwm2 = GPIO.PWM(self.In2, 100) # Apply full voltage to device
-        self.pwm1.start(0) # start with motor off
-        self.pwm2.start(0) # start with motor off
-        
-    def moveForward(self, speed, t=0): # 'speed' allows the user to input spee
-        GPIO.output(self.In1, GPIO.LOW)
-        GPIO.output(self.In2, GPIO.HIGH)
-        self.pwm2.ChangeDutyCycle(speed)
-        time.sleep(t)                        # delay
-        
-    def moveBackward(self, speed, t=0): # 'speed' allows the user to input spee
-        GPIO.output(self.In1, GPIO.HIGH)
-        GPIO.output(self.In2, GPIO.LOW)
-        self.pwm1.ChangeDutyCycle(speed)
-        time.sleep(t)                        # delay
-    
-    def stop(self):
-        self.pwm1.ChangeDutyCycle(0)
-        self.pwm2.ChangeDutyCycle(0)
-
-motor1  = Motor(13, 6)
-motor2  = Motor(17, 27)
-motor3  = Motor(23, 24)
-
-previous_user_expanded_value = None
-box_expanded_to_full = False
-
-keycloak = Keycloak(env.str("ADMIN_CLIENT_SECRET"), env.str("MEMBER_CLIENT_SECRET"), env.str("KEYCLOAK_HOST"))
-
-try:
-    log.info(f"Connecting to {env.str('DB_NAME')} database from Raspberry Pi")
-    conn = psycopg2.connect(host=env.str("DB_HOST"),
-                            port=env.str("DB_PORT"),
-                            database=env.str("DB_NAME"),
-                            user=env.str("DB_USER"),
-                            password=env.str("DB_PASSWORD"))
-    log.info(f"Connected to {env.str('DB_NAME')} database")
-except Exception as e:
-    log.critical(e)
+APP_SECRET = env.str("APP_SECRET")
+
+controller = new_controller(env)
+
+box_events = BoxEventBus(queue_size=env.int("STATE_STREAM_QUEUE_SIZE", 64))
+box_listener = BoxStateListener(box_events, common.pool.connect_kwargs)
+stream_slots = threading.BoundedSemaphore(env.int("STATE_STREAM_MAX_CLIENTS", 4))
+
+state_cache = BoxStateCache(box_listener,
+                            ttl=env.float("STATE_CACHE_TTL", 30),
+                            max_size=env.int("STATE_CACHE_SIZE", 1024))
+box_events.observe(state_cache.on_event)
+
+order_aggregates = OrderAggregateCache(ttl=env.float("ORDER_AGGREGATES_CACHE_TTL", 10),
+                                       max_size=env.int("ORDER_AGGREGATES_CACHE_SIZE", 1024))
+
+keycloak = Keycloak(env.str("ADMIN_CLIENT_SECRET"),
+                    env.str("MEMBER_CLIENT_SECRET"),
+                    env.str("KEYCLOAK_HOST"),
+                    local_verify=env.bool("KEYCLOAK_LOCAL_VERIFY", False),
+                    audience=env.str("KEYCLOAK_AUDIENCE", None) or None,
+                    issuer=env.str("KEYCLOAK_ISSUER", None) or None,
+                    admin_token_margin=env.int("KEYCLOAK_ADMIN_TOKEN_MARGIN", 30),
+                    session_cache=SessionCache(ttl=env.float("KEYCLOAK_SESSION_CACHE_TTL", 5),
+                                               negative_ttl=env.float("KEYCLOAK_SESSION_NEGATIVE_TTL", 1),
+                                               max_size=env.int("KEYCLOAK_SESSION_CACHE_SIZE", 1024)),
+                    http=transport.new_session(pool_size=env.int("KEYCLOAK_POOL_SIZE", 10),
+                                               retries=env.int("KEYCLOAK_RETRIES", 2),
+                                               backoff_factor=env.float("KEYCLOAK_RETRY_BACKOFF", 0.2)),
+                    timeout=(env.float("KEYCLOAK_CONNECT_TIMEOUT", 3), env.float("KEYCLOAK_READ_TIMEOUT", 10)))
+keycloak.http.hooks["response"].append(metrics.count_keycloak_response)
+
+pipeline = MemberPipeline(keycloak)
+
+def runtime_metrics():
+    cache_stats = keycloak.session_cache.stats()
+    pool_stats = common.pool.stats()
+    state_cache_stats = state_cache.stats()
+    order_aggregates_stats = order_aggregates.stats()
+    return [
+        ("pelbox_session_cache_hits", {}, cache_stats["hits"]),
+        ("pelbox_session_cache_misses", {}, cache_stats["misses"]),
+        ("pelbox_session_cache_coalesced", {}, cache_stats["coalesced"]),
+        ("pelbox_session_cache_size", {}, cache_stats["size"]),
+        ("pelbox_db_pool_connections", {}, pool_stats["size"]),
+        ("pelbox_db_pool_idle_connections", {}, pool_stats["idle"]),
+        ("pelbox_state_stream_subscribers", {}, box_events.count()),
+        ("pelbox_state_cache_hits", {}, state_cache_stats["hits"]),
+        ("pelbox_state_cache_misses", {}, state_cache_stats["misses"]),
+        ("pelbox_state_cache_size", {}, state_cache_stats["size"]),
+        ("pelbox_order_aggregates_cache_hits", {}, order_aggregates_stats["hits"]),
+        ("pelbox_order_aggregates_cache_misses", {}, order_aggregates_stats["misses"]),
+        ("pelbox_order_aggregates_cache_size", {}, order_aggregates_stats["size"])
+    ]
+
+metrics.registry.register_callback(runtime_metrics)
+
+def start_database():
+    common.pool.open()
+    return True
+
+def start_box_events():
+    box_listener.start()
+    return True
+
+startup = Startup(retry_interval=env.float("STARTUP_RETRY_INTERVAL", 5))
+startup.add("database", start_database)
+startup.add("keycloak", keycloak.start)
+startup.add("hardware", controller.start)
+startup.add("box_events", start_box_events, required=False)
+
+@management.before_request
+def start_request_metrics():
+    metrics.start_request()
+
+@management.after_request
+def finish_request_metrics(response):
+    metrics.finish_request(request.url_rule.rule if request.url_rule else "unknown", response.status_code)
+    return response
+
+INTERNAL_ADDRESSES = set(env.list("INTERNAL_ADDRESSES", ["127.0.0.1", "::1"]))
+
+def internal(func):
+    """
+        Refuse requests to internal counters unless they come from one of INTERNAL_ADDRESSES.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if request.remote_addr not in INTERNAL_ADDRESSES:
+            return responses.static_response("forbidden")
+        return func(*args, **kwargs)
+    return wrapper
+
+@management.route("/metrics", methods=["GET"])
+@internal
+def prometheus_metrics():
+    return Response(metrics.registry.render() + controller.metrics(), mimetype="text/plain; version=0.0.4")
+
+@management.route("/ready", methods=["GET"])
+def ready():
+    if startup.ready():
+        return responses.json_response({"ready": True, "tasks": startup.status()})
+    return responses.json_response({"ready": False, "tasks": startup.status()}, 503)
+
+@management.route("/session_cache_stats", methods=["GET"])
+@internal
+def session_cache_stats():
+    return responses.json_response({"success": True, "stats": keycloak.session_cache.stats()})
+
+def load_box_state(username):
+    """
+        Returns (member_id, pelbox, etag) of the member box, or None if it can't be loaded.
+
+        State comes from state_cache when it can be trusted, otherwise it is read from the database. ETag is
+        the cache version of the box, or a hash of the state while box state notifications aren't received.
+    """
+    box_listener.start()
+
+    member_id = state_cache.member_id(username)
+    if member_id is not None:
+        cached = state_cache.get(member_id)
+        if cached is not None:
+            pelbox, version = cached
+            return member_id, pelbox, state_cache.etag(member_id, version)
+
+    version = state_cache.version(member_id) if member_id is not None else None
+    device_context = common.get_device_context(username)
+    if device_context is None:
+        return None
+
+    member_id = device_context[0]
+    pelbox = PelBox.from_row(device_context[1:])
+    state_cache.remember_member(username, member_id)
+
+    if version is not None and state_cache.live():
+        state_cache.store(member_id, pelbox, version)
+        return member_id, pelbox, state_cache.etag(member_id, version)
+
+    return member_id, pelbox, hashlib.sha1(responses.pelbox_json(pelbox).encode("utf-8")).hexdigest()
+
+def box_state_response(username):
+    """
+        Response of locking_state and dismantle_state. Answers 304 without serializing state when If-None-Match
+        matches the current ETag.
+    """
+    box_state = load_box_state(username)
+    if box_state is None:
+        return responses.static_response("something_went_wrong")
+
+    member_id, pelbox, etag = box_state
+    status = pelbox.user_security_key != None and pelbox.user_security_key == APP_SECRET
+    common.write_box_state(member_id, {"connected": status}, observed=pelbox, security_key=pelbox.user_security_key)
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = responses.box_state_response(status, pelbox)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
 
 @management.route("/locking_state", methods=["GET"])
-def locking_state():
-    try:
-        data_json = dict(request.headers)
-        data_json = {key: None if data_json[key] == "" else data_json[key] for key in data_json}
-
-        logged_in, status_code = keycloak.is_member_logged(data_json["Access-Token"])
-        if status_code == 200 and logged_in:
-            username = jwt.decode(data_json["Access-Token"], verify=False)["preferred_username"]
-            member_details = common.get_member_details(username)
-            member = Member.new(*member_details)
-
-            pelbox_settings = common.get_pelbox_settings(member.id)
-            pelbox = PelBox.new(*pelbox_settings)
-
-            status = pelbox.user_security_key != None and pelbox.user_security_key == env.str("APP_SECRET")
-            common.set_box_connected(pelbox.user_security_key, member.id, status)
-            return jsonify({"success": status, "settings": pelbox.json_data()}), 200, {"ContentType":"application/json"}
-        elif status_code == 200 and not logged_in:
-            return jsonify({"success": False, "message": f"Member is not logged in"}), 401, {"ContentType":"application/json"}
-        else:
-            return jsonify({"success": False, "message": f"Something went wrong"}), 500, {"ContentType":"application/json"}
-    except KeyError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "Missing arguments"}), 400, {"ContentType":"application/json"}
-    except json.decoder.JSONDecodeError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "JSON is badly formatted"}), 400, {"ContentType":"application/json"}
+@pipeline.route(source="headers")
+def locking_state(context):
+    return box_state_response(context.username)
+
+def server_sent_event(name, data):
+    return f"event: {name}\ndata: {responses.dumps(data).decode('utf-8')}\n\n"
+
+def stream_state(member_id):
+    """
+        Full box state for the stream, None if it can't be read. The stream then ends and the client reconnects.
+    """
+    row = common.get_pelbox_settings(member_id)
+    if row is None:
+        log.critical(f"Box state of member {member_id} could not be read, closing state stream")
+        return None
+    return PelBox.from_row(row).json_data()
+
+def box_state_events(member_id, subscriber):
+    """
+        Yield full box state and then changed fields as server sent events until the stream gets too old.
+
+        State is read after subscribing so no change is lost between the read and the first event. On RESYNC
+        full state is read and sent again.
+    """
+    keepalive = env.float("STATE_STREAM_KEEPALIVE", 15)
+    deadline = time.monotonic() + env.float("STATE_STREAM_MAX_AGE", 300)
+
+    yield f"retry: {env.int('STATE_STREAM_RETRY_MS', 3000)}\n\n"
+    state = stream_state(member_id)
+    if state is None:
+        return
+    yield server_sent_event("state", state)
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+
+        try:
+            event = subscriber.get(timeout=min(keepalive, remaining))
+        except queue.Empty:
+            yield ": keepalive\n\n"
+            continue
+
+        if event == RESYNC:
+            state = stream_state(member_id)
+            if state is None:
+                return
+            yield server_sent_event("state", state)
+            continue
+
+        delta = {field: value for field, value in event.items() if state.get(field) != value}
+        if delta:
+            state.update(delta)
+            yield server_sent_event("delta", delta)
+
+@management.route("/box_state_stream", methods=["GET"])
+@pipeline.route(source="headers", load="device")
+def box_state_stream(context):
+    member_id, pelbox = context.member_id, context.pelbox
+
+    if not stream_slots.acquire(blocking=False):
+        return responses.static_response("too_many_streams")
+
+    status = pelbox.user_security_key != None and pelbox.user_security_key == APP_SECRET
+    common.write_box_state(member_id, {"connected": status}, observed=pelbox, security_key=pelbox.user_security_key)
+
+    subscriber = box_events.subscribe(member_id)
+    box_listener.start()
+
+    def close_stream():
+        box_events.unsubscribe(member_id, subscriber)
+        stream_slots.release()
+
+    response = Response(stream_with_context(box_state_events(member_id, subscriber)),
+                        mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    response.call_on_close(close_stream)
+    return response
+
+@management.route("/logout", methods=["PUT"])
+@pipeline.route()
+def logout(context):
+    if not keycloak.member_logout(context.data["refresh_token"]):
+        return responses.static_response("something_went_wrong")
+
+    return responses.static_response("success")
 
 @management.route("/set_locking", methods=["PUT"])
-def locking():
-    try:
-        data_json = json.loads(request.data.decode("utf-8"))
-        data_json = {key: None if data_json[key] == "" else data_json[key] for key in data_json}
- 
-        logged_in, status_code = keycloak.is_member_logged(data_json["access_token"])
-        if status_code == 200 and logged_in:
-            username = jwt.decode(data_json["access_token"], verify=False)["preferred_username"]
-            member_details = common.get_member_details(username)
-            member = Member.new(*member_details)
-
-            common.update_locking(member.id, data_json["locked"])
-            return jsonify({"success": True}), 200, {"ContentType":"application/json"}
-        elif status_code == 200 and not logged_in:
-            return jsonify({"success": False, "message": f"Member is not logged in"}), 401, {"ContentType":"application/json"}
-        else:
-            return jsonify({"success": False, "message": f"Something went wrong"}), 500, {"ContentType":"application/json"}
-    except KeyError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "Missing arguments"}), 400, {"ContentType":"application/json"}
-    except json.decoder.JSONDecodeError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "JSON is badly formatted"}), 400, {"ContentType":"application/json"}
+@pipeline.route(load="member")
+def locking(context):
+    common.write_box_state(context.member.id, {"locked": context.data["locked"]})
+    return responses.static_response("success")
 
 @management.route("/dismantle_state", methods=["GET"])
-def dismantle_state():
-    try:
-        data_json = dict(request.headers)
-        data_json = {key: None if data_json[key] == "" else data_json[key] for key in data_json}
-
-        logged_in, status_code = keycloak.is_member_logged(data_json["Access-Token"])
-        if status_code == 200 and logged_in:
-            username = jwt.decode(data_json["Access-Token"], verify=False)["preferred_username"]
-            member_details = common.get_member_details(username)
-            member = Member.new(*member_details)
-
-            pelbox_settings = common.get_pelbox_settings(member.id)
-            pelbox = PelBox.new(*pelbox_settings)
-
-            status = pelbox.user_security_key != None and pelbox.user_security_key == env.str("APP_SECRET")
-            common.set_box_connected(pelbox.user_security_key, member.id, status)
-            return jsonify({"success": status, "settings": pelbox.json_data()}), 200, {"ContentType":"application/json"}
-        elif status_code == 200 and not logged_in:
-            return jsonify({"success": False, "message": f"Member is not logged in"}), 401, {"ContentType":"application/json"}
-        else:
-            return jsonify({"success": False, "message": f"Something went wrong"}), 500, {"ContentType":"application/json"}
-    except KeyError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "Missing arguments"}), 400, {"ContentType":"application/json"}
-    except json.decoder.JSONDecodeError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "JSON is badly formatted"}), 400, {"ContentType":"application/json"}
+@pipeline.route(source="headers")
+def dismantle_state(context):
+    return box_state_response(context.username)
 
 @management.route("/set_dismantle", methods=["PUT"])
-def dismantle():
-    try:
-        data_json = json.loads(request.data.decode("utf-8"))
-        data_json = {key: None if data_json[key] == "" else data_json[key] for key in data_json}
- 
-        logged_in, status_code = keycloak.is_member_logged(data_json["access_token"])
-        if status_code == 200 and logged_in:
-            username = jwt.decode(data_json["access_token"], verify=False)["preferred_username"]
-            member_details = common.get_member_details(username)
-            member = Member.new(*member_details)
-
-            common.update_dismantle(member.id, data_json["dismantle"])
-            if data_json["dismantle"]:
-                GPIO.output(relay, 1)
-            else:
-                GPIO.output(relay, 0)
-            return jsonify({"success": True}), 200, {"ContentType":"application/json"}
-        elif status_code == 200 and not logged_in:
-            return jsonify({"success": False, "message": f"Member is not logged in"}), 401, {"ContentType":"application/json"}
-        else:
-            return jsonify({"success": False, "message": f"Something went wrong"}), 500, {"ContentType":"application/json"}
-    except KeyError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "Missing arguments"}), 400, {"ContentType":"application/json"}
-    except json.decoder.JSONDecodeError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "JSON is badly formatted"}), 400, {"ContentType":"application/json"}
-
-def move_motors_full_forward(current_value):
-    motor1.moveForward(100, 5 - current_value) # Move Forward with 80% voltage for value seconds
-    time.sleep(0.25) 
-    motor1.stop()
-
-    global box_expanded_to_full
-    box_expanded_to_full = True
-    motor2.moveForward(100, 2)
-    time.sleep(1) 
-    motor2.stop()
-
-def move_motors_full_backward(current_value):
-    motor1.moveBackward(100, 1) # Move Forward with 80% voltage for value seconds
-    time.sleep(0.25) 
-    motor1.stop()
-    current_value = 0
-
-    motor1.moveBackward(100, 5 - current_value) # Move Forward with 80% voltage for value seconds
-    time.sleep(0.25) 
-    motor1.stop()
-
-    motor2.moveBackward(100, 1)
-    time.sleep(0.25)
-    motor2.stop()
-
-    global box_expanded_to_full
-    box_expanded_to_full = False
-    motor2.moveBackward(100, 2)
-    time.sleep(1)
-    motor2.stop()
-
-def move_motors_forward(value):
-    motor1.moveForward(100, 1) # Move Forward with 80% voltage for value seconds
-    time.sleep(0.25) 
-    motor1.stop()
-
-def move_motors_back(value):
-    motor1.moveBackward(100, 1)
-    time.sleep(0.25)
-    motor1.stop()
+@pipeline.route(load="member")
+def dismantle(context):
+    # Relay is switched first so a refused relay command leaves the persisted state untouched
+    with metrics.phase("gpio"):
+        controller.set_relay(bool(context.data["dismantle"]))
+    common.write_box_state(context.member.id, {"dismantle": context.data["dismantle"]})
+    return responses.static_response("success")
 
 @management.route("/set_expanding_value", methods=["PUT"])
-def expanding_value():
-    try:
-        data_json = json.loads(request.data.decode("utf-8"))
-        data_json = {key: None if data_json[key] == "" else data_json[key] for key in data_json}
- 
-        logged_in, status_code = keycloak.is_member_logged(data_json["access_token"])
-        if status_code == 200 and logged_in:
-            username = jwt.decode(data_json["access_token"], verify=False)["preferred_username"]
-            member_details = common.get_member_details(username)
-            member = Member.new(*member_details)
-
-            pelbox_settings = common.get_pelbox_settings(member.id)
-            pelbox = PelBox.new(*pelbox_settings)
-
-            global previous_user_expanded_value
-            if previous_user_expanded_value == None:
-                previous_user_expanded_value = pelbox.expanding_value
-
-            expanding_value = data_json["expanding-value"]
-            if expanding_value == 5:
-                move_motors_full_forward(pelbox.expanding_value)
-            elif expanding_value == 0 and box_expanded_to_full:
-                move_motors_full_backward(pelbox.expanding_value)
-            elif previous_user_expanded_value < expanding_value:
-                move_motors_forward(expanding_value)
-            else:
-                move_motors_back(expanding_value)
-
-            previous_user_expanded_value = expanding_value
-
-            common.update_expanding_value(member.id, expanding_value)
-            return jsonify({"success": True}), 200, {"ContentType":"application/json"}
-        elif status_code == 200 and not logged_in:
-            return jsonify({"success": False, "message": f"Member is not logged in"}), 401, {"ContentType":"application/json"}
-        else:
-            return jsonify({"success": False, "message": f"Something went wrong"}), 500, {"ContentType":"application/json"}
-    except KeyError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "Missing arguments"}), 400, {"ContentType":"application/json"}
-    except json.decoder.JSONDecodeError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "JSON is badly formatted"}), 400, {"ContentType":"application/json"}
+@pipeline.route(load="device")
+def expanding_value(context):
+    if type(context.data["expanding-value"]) is not int or context.data["expanding-value"] not in EXPANDING_CALIBRATION:
+        return responses.static_response("expanding_out_of_range")
 
+    job = controller.expand(context.member_id, context.data["expanding-value"])
+    return responses.json_response({"success": True, "job_id": job["id"]}, 202)
 
 @management.route("/set_door_status", methods=["PUT"])
-def set_door_status():
+@pipeline.route(load="device")
+def set_door_status(context):
+    job = controller.door(context.member_id, context.data["door_status"])
+    return responses.json_response({"success": True, "job_id": job["id"]}, 202)
+
+BATCH_OPERATIONS = {
+    "set_locking": "locked",
+    "set_dismantle": "dismantle",
+    "set_door_status": "door_status",
+    "set_expanding_value": "expanding-value"
+}
+
+def batch_operations(operations):
+    """
+        Validate batch operations before anything runs.
+
+        Every operation names a single operation route in op and carries the argument of that route.
+
+        Returns:
+            (operations as {"op", "value"} dicts, None) or (None, error message)
+    """
+    if not isinstance(operations, list) or not operations:
+        return None, "Operations have to be a non empty list"
+    if len(operations) > env.int("BATCH_MAX_OPERATIONS", 16):
+        return None, f"At most {env.int('BATCH_MAX_OPERATIONS', 16)} operations are allowed"
+
+    parsed = []
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            return None, f"Operation {index} has to be an object"
+
+        operation = {key: None if operation[key] == "" else operation[key] for key in operation}
+        argument = BATCH_OPERATIONS.get(operation["op"]) if isinstance(operation["op"], str) else None
+        if argument is None:
+            return None, f"Operation {index} is unknown"
+
+        value = operation[argument]
+        if operation["op"] == "set_expanding_value" and (type(value) is not int or value not in EXPANDING_CALIBRATION):
+            return None, f"Operation {index}: Expanding value out of range"
+        if operation["op"] == "set_door_status" and value not in ("open", "close"):
+            return None, f"Operation {index}: Door status has to be open or close"
+
+        parsed.append({"op": operation["op"], "value": value})
+
+    return parsed, None
+
+@management.route("/batch", methods=["PUT"])
+@pipeline.route()
+def batch(context):
+    operations, error = batch_operations(context.data["operations"])
+    if error is not None:
+        return responses.json_response({"success": False, "error": error}, 400)
+
+    context.load_device()
+    job = controller.batch(context.member_id, operations)
+    results = [{"op": operation["op"], "status": "queued"} for operation in operations]
+    return responses.json_response({"success": True, "job_id": job["id"], "operations": results}, 202)
+
+@management.route("/job_status/<job_id>", methods=["GET"])
+@pipeline.route(source="headers", load="member")
+def job_status(context, job_id):
+    job = controller.job(job_id, context.member.id)
+    if job is None:
+        return responses.static_response("job_not_found")
+
+    return responses.json_response({"success": True, "job": job})
+
+def orders_body(first, rows, limit):
+    """
+        Yield orders page as chunked JSON, next_before is the cursor of the next page or null on the last one.
+    """
+    page = {"count": 0, "last_id": None}
+
+    def counted():
+        order = first
+        while order is not None:
+            page["count"] += 1
+            page["last_id"] = order["id"]
+            yield order
+            order = next(rows, None)
+
+    yield b'{"success":true,"orders":'
+    yield from responses.stream_json_array(counted())
+    next_before = page["last_id"] if page["count"] == limit else None
+    yield b',"next_before":' + responses.dumps(next_before) + b"}"
+
+@management.route("/orders", methods=["GET"])
+@pipeline.route(source="headers")
+def orders(context):
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", env.int("ORDERS_PAGE_SIZE", 50), type=int)
+    limit = max(1, min(limit, env.int("ORDERS_MAX_PAGE_SIZE", 500)))
+
+    # First row is read before the response starts so a failing query still gets an error status
+    rows = common.iter_member_orders(context.username, before, limit)
     try:
-        data_json = json.loads(request.data.decode("utf-8"))
-        data_json = {key: None if data_json[key] == "" else data_json[key] for key in data_json}
- 
-        logged_in, status_code = keycloak.is_member_logged(data_json["access_token"])
-        if status_code == 200 and logged_in:
-            username = jwt.decode(data_json["access_token"], verify=False)["preferred_username"]
-            member_details = common.get_member_details(username)
-            member = Member.new(*member_details)
-
-            pelbox_settings = common.get_pelbox_settings(member.id)
-            pelbox = PelBox.new(*pelbox_settings)
-
-            door_status = data_json["door_status"]
-            if door_status == "open" and pelbox.door_open == False:
-                motor3.moveForward(100, 5)
-                time.sleep(0.25)
-                motor3.stop()
-            elif door_status == "close" and pelbox.door_open == True:
-                motor3.moveBackward(100, 5)
-                time.sleep(0.25)
-                motor3.stop()
-
-            common.update_door_status(member.id, True if door_status == "open" else False)
-            return jsonify({"success": True}), 200, {"ContentType":"application/json"}
-        elif status_code == 200 and not logged_in:
-            return jsonify({"success": False, "message": f"Member is not logged in"}), 401, {"ContentType":"application/json"}
-        else:
-            return jsonify({"success": False, "message": f"Something went wrong"}), 500, {"ContentType":"application/json"}
-    except KeyError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "Missing arguments"}), 400, {"ContentType":"application/json"}
-    except json.decoder.JSONDecodeError as e:
-        log.critical(e)
-        return jsonify({"success": False, "error": "JSON is badly formatted"}), 400, {"ContentType":"application/json"}
+        first = next(rows, None)
+    except Exception:
+        return responses.static_response("something_went_wrong")
+
+    response = Response(orders_body(first, rows, limit), headers=responses.HEADERS, mimetype="application/json")
+    response.call_on_close(rows.close)
+    return response
+
+@management.route("/orders_summary", methods=["GET"])
+@pipeline.route(source="headers")
+def orders_summary(context):
+    aggregates = order_aggregates.get(context.username)
+    if aggregates is None:
+        return responses.static_response("something_went_wrong")
+
+    order_count, order_total = aggregates
+    return responses.json_response({
+        "success": True,
+        "order_count": order_count,
+        "order_total": None if order_total is None else str(order_total)
+    })
+
+@management.route("/notifications", methods=["GET"])
+@pipeline.route(source="headers")
+def notifications(context):
+    since = request.args.get("since", type=int)
+    limit = request.args.get("limit", env.int("NOTIFICATIONS_PAGE_SIZE", 50), type=int)
+    limit = max(1, min(limit, env.int("NOTIFICATIONS_MAX_PAGE_SIZE", 500)))
+
+    page = common.get_notifications_since(context.username, since, limit)
+    if page is None:
+        return responses.static_response("something_went_wrong")
+
+    notifications, cursor = page
+    return responses.json_response({
+        "success": True,
+        "notifications": notifications,
+        "cursor": cursor,
+        "more": len(notifications) == limit and cursor != since
+    })
+
+def notification_ids(ids):
+    """
+        Returns (ids, None) or (None, error message).
+    """
+    if not isinstance(ids, list) or not ids:
+        return None, "Ids have to be a non empty list"
+    if len(ids) > env.int("NOTIFICATIONS_MAX_MARK_READ", 1000):
+        return None, f"At most {env.int('NOTIFICATIONS_MAX_MARK_READ', 1000)} ids are allowed"
+    if not all(type(id) is int for id in ids):
+        return None, "Ids have to be integers"
+    return ids, None
+
+@management.route("/notifications/read", methods=["PUT"])
+@pipeline.route()
+def notifications_read(context):
+    if context.data.get("ids") is not None:
+        ids, error = notification_ids(context.data["ids"])
+        if error is not None:
+            return responses.json_response({"success": False, "error": error}, 400)
+        updated = common.mark_notifications_read(context.username, ids=ids)
+    else:
+        up_to = context.data["up_to"]
+        if type(up_to) is not int:
+            return responses.json_response({"success": False, "error": "up_to has to be an integer"}, 400)
+        updated = common.mark_notifications_read(context.username, up_to=up_to)
+
+    if updated is None:
+        return responses.static_response("something_went_wrong")
+
+    return responses.json_response({"success": True, "updated": updated})
@@ -1,6 +1,10 @@
 import json
 
 class Member:
+    __slots__ = ("id", "username", "email", "password", "phone_token", "access_token", "refresh_token", "first_name",
+                 "last_name", "gender", "country", "city", "city_address", "postal_code", "phone_number",
+                 "organization_name", "organization_id", "organization_email")
+
     def __init__(self, data):
         data_json = json.loads(data.decode("utf-8"))
 
@@ -26,40 +30,21 @@ class Member:
 
     @staticmethod
     def new(id, username, email, first_name, last_name, gender, country, city, city_address, postal_code, phone_number, phone_token, organization_name, organization_id, organization_email):
-        new_data = {
-            "id": id,
-            "username": username, 
-            "email": email,
-            "password": "",
-            "first_name": first_name, 
-            "last_name": last_name, 
-            "gender": gender, 
-            "country": country, 
-            "city": city, 
-            "city_address": city_address, 
-            "postal_code": postal_code, 
-            "phone_number": phone_number,
-            "phone_token": phone_token,
-            "organization_name": organization_name,
-            "organization_id": organization_id,
-            "organization_email": organization_email
-        }
+        return Member.from_row((id, username, email, first_name, last_name, gender, country, city, city_address, postal_code, phone_number, phone_token, organization_name, organization_id, organization_email))
 
-        member = Member(json.dumps(new_data).encode("utf-8"))
-        member.id = new_data["id"]
-        member.first_name = new_data["first_name"]
-        member.last_name = new_data["last_name"]
-        member.gender = new_data["gender"]
-        member.country = new_data["country"]
-        member.city = new_data["city"]
-        member.city_address = new_data["city_address"]
-        member.postal_code = new_data["postal_code"]
-        member.phone_number = new_data["phone_number"]
-        member.phone_token = new_data["phone_token"]
-        member.organization_name = new_data["organization_name"]
-        member.organization_id = new_data["organization_id"]
-        member.organization_email = new_data["organization_email"]
+    @classmethod
+    def from_row(cls, row):
+        """
+            Build member straight from a get_member_details row without going through JSON.
+        """
+        member = cls.__new__(cls)
+        (member.id, member.username, member.email, member.first_name, member.last_name, member.gender, member.country,
+         member.city, member.city_address, member.postal_code, member.phone_number, member.phone_token,
+         member.organization_name, member.organization_id, member.organization_email) = row
 
+        member.password = ""
+        member.access_token = None
+        member.refresh_token = None
         return member
 
     def json_data(self):
@@ -0,0 +1,155 @@
+import time
+import bisect
+import threading
+
+from contextlib import contextmanager
+from functools import wraps
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Registry:
+    def __init__(self):
+        """
+            In-process counters and histograms rendered in Prometheus text format.
+
+            Metrics are created on first use, labels are passed as dicts. Callbacks registered with
+            register_callback are called on render and return (name, labels, value) gauge samples.
+        """
+        self.counters = {}
+        self.histograms = {}
+        self.callbacks = []
+        self.lock = threading.Lock()
+
+    def inc(self, name, labels=None, amount=1):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, labels=None):
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def register_callback(self, callback):
+        self.callbacks.append(callback)
+
+    def render(self, extra_labels=None):
+        """
+            Render all metrics, extra_labels are added to every sample.
+        """
+        extra = tuple(sorted((extra_labels or {}).items()))
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+
+            for (name, labels), value in counters:
+                lines.append(f"{name}{format_labels(labels + extra)} {value}")
+
+            for (name, labels), histogram in histograms:
+                labels = labels + extra
+                cumulative = 0
+                for bucket, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', bucket),))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+        for callback in self.callbacks:
+            for name, labels, value in callback():
+                lines.append(f"{name}{format_labels(tuple(sorted(labels.items())) + extra)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+registry = Registry()
+
+# Phases of the request handled by the current thread, a request is handled on one thread from start to finish.
+# Kept out of flask.g so the database and hardware layers importing this module don't depend on Flask.
+request_state = threading.local()
+
+def start_request():
+    request_state.started = time.perf_counter()
+    request_state.phases = {}
+
+def finish_request(route, status_code):
+    """
+        Record total duration and per phase durations of the current request.
+    """
+    started = getattr(request_state, "started", None)
+    if started is None:
+        return
+
+    phases = request_state.phases
+    request_state.started = None
+    request_state.phases = None
+
+    registry.observe("pelbox_request_duration_seconds", time.perf_counter() - started, {"route": route, "status": status_code})
+    for phase_name, elapsed in phases.items():
+        registry.observe("pelbox_request_phase_seconds", elapsed, {"route": route, "phase": phase_name})
+
+def add_phase(name, elapsed):
+    phases = getattr(request_state, "phases", None)
+    if phases is not None:
+        phases[name] = phases.get(name, 0) + elapsed
+
+@contextmanager
+def phase(name):
+    """
+        Time the block as phase of the current request, phases with the same name add up.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_phase(name, time.perf_counter() - started)
+
+def timed_phase(name):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def timed_query(func):
+    """
+        Record duration of common.* query function per function name and add it to request db phase.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            registry.observe("pelbox_db_query_seconds", elapsed, {"query": func.__name__})
+            add_phase("db", elapsed)
+    return wrapper
+
+def count_keycloak_response(response, *args, **kwargs):
+    """
+        requests response hook counting calls sent to Keycloak.
+    """
+    registry.inc("pelbox_keycloak_requests_total", {"method": response.request.method, "status": response.status_code})
@@ -0,0 +1,116 @@
+import logging
+
+from rpi.sequencer import Sequencer, Step
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+# Seconds each expanding motor has to run at full speed from its home position to reach the expanding value.
+EXPANDING_CALIBRATION = {
+    0: {"motor1": 0.0, "motor2": 0.0},
+    1: {"motor1": 1.0, "motor2": 0.0},
+    2: {"motor1": 2.0, "motor2": 0.0},
+    3: {"motor1": 3.0, "motor2": 0.0},
+    4: {"motor1": 4.0, "motor2": 0.0},
+    5: {"motor1": 5.0, "motor2": 3.0}
+}
+
+class Move:
+    def __init__(self, motor, forward, duration):
+        self.motor = motor
+        self.forward = forward
+        self.duration = duration
+
+    def __repr__(self):
+        return f"Move({self.motor}, {'forward' if self.forward else 'backward'}, {self.duration})"
+
+class MotionPlanner:
+    def __init__(self, motors, calibration=EXPANDING_CALIBRATION, speed=100, homing_margin=1.0, sequencer=None, parallel_stages=False):
+        """
+            Tracks position of the expanding motors and moves them straight to the requested expanding value.
+
+            motors maps motor names used in calibration to Motor objects. Positions are kept in seconds of
+            motor run time from home. Moves back to home run homing_margin seconds longer so the motor ends
+            against its end stop and position errors don't accumulate.
+
+            Motors move one after another in calibration order. With parallel_stages enabled, for boxes whose
+            stages can move independently, all motors move at the same time.
+        """
+        self.motors = motors
+        self.calibration = calibration
+        self.speed = speed
+        self.homing_margin = homing_margin
+        self.sequencer = sequencer or Sequencer()
+        self.parallel_stages = parallel_stages
+        self.positions = None
+
+    def sync(self, expanding_value):
+        """
+            Take position from the last persisted expanding value if position is not known yet.
+
+            A persisted value missing from calibration, or NULL, says nothing about the position, motors are homed
+            then so the following move starts from a known position.
+        """
+        if self.positions is not None:
+            return
+
+        if expanding_value in self.calibration:
+            self.positions = dict(self.calibration[expanding_value])
+        else:
+            log.warning(f"Persisted expanding value {expanding_value} is not calibrated, homing expanding motors")
+            self.home()
+
+    def home(self):
+        """
+            Retract every motor as if it stood at its furthest calibrated position, ending against its end stop.
+        """
+        self.positions = {motor: max(targets.get(motor, 0) for targets in self.calibration.values()) for motor in self.motors}
+        self.move_to(0)
+
+    def plan(self, expanding_value):
+        """
+            Returns list of Move needed to get from current position to the expanding value, one move per motor.
+        """
+        moves = []
+        for motor, target in self.calibration[expanding_value].items():
+            delta = target - self.positions[motor]
+            if target == 0 and self.positions[motor] > 0:
+                delta -= self.homing_margin
+
+            if delta != 0:
+                moves.append(Move(motor, delta > 0, abs(delta)))
+
+        return moves
+
+    def steps(self, expanding_value):
+        """
+            Returns sequencer steps for moves to the expanding value.
+        """
+        steps = []
+        for move in self.plan(expanding_value):
+            after = () if self.parallel_stages or not steps else (steps[-1].name,)
+            steps.append(Step(move.motor, move.motor, self.action(move, self.calibration[expanding_value][move.motor]), after))
+
+        return steps
+
+    def action(self, move, target):
+        def run():
+            motor = self.motors[move.motor]
+            if move.forward:
+                motor.moveForward(self.speed, move.duration)
+            else:
+                motor.moveBackward(self.speed, move.duration)
+            motor.stop()
+
+            self.positions[move.motor] = target
+            log.info(f"{move} finished")
+
+        return run
+
+    def move_to(self, expanding_value):
+        """
+            Plan and run moves to the expanding value, position is updated after each finished move.
+        """
+        self.sequencer.run(self.steps(expanding_value))
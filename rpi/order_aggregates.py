@@ -0,0 +1,120 @@
+"""
+    Order count and total per member from member_order_aggregates, with an in-process cache in front of it.
+
+    The table is filled by migrations/002_member_order_aggregates.sql. Commands to verify it and to recompute it
+    when it drifted, for example after orders were truncated:
+        python -m rpi.order_aggregates rebuild
+        python -m rpi.order_aggregates check
+"""
+import sys
+import time
+import argparse
+import logging
+import threading
+from collections import OrderedDict
+
+from rpi import common
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+class OrderAggregateCache:
+    def __init__(self, ttl=10, max_size=1024):
+        """
+            Bounded LRU cache of (order count, order total) per username.
+
+            Orders are written outside this service, so entries can't be invalidated and live for ttl seconds.
+            Failed reads are not cached.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, username):
+        """
+            Returns (order count, order total) of the member, None if it couldn't be read.
+        """
+        with self.lock:
+            entry = self.entries.get(username)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(username)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        aggregates = common.get_member_orders_details_all(username)
+        if aggregates is None:
+            return None
+
+        with self.lock:
+            self.entries[username] = (aggregates, time.monotonic() + self.ttl)
+            self.entries.move_to_end(username)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return aggregates
+
+    def invalidate(self, username=None):
+        """
+            Drop cached aggregates of the member, or of all members when username is None.
+        """
+        with self.lock:
+            if username is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(username, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.entries)
+            }
+
+def rebuild():
+    started = time.perf_counter()
+    members = common.rebuild_order_aggregates()
+    if members is None:
+        log.critical("Rebuilding order aggregates failed")
+        return 1
+
+    log.info(f"Rebuilt order aggregates of {members} members in {time.perf_counter() - started:.2f}s")
+    return 0
+
+def check():
+    mismatches = common.check_order_aggregates()
+    if mismatches is None:
+        log.critical("Checking order aggregates failed")
+        return 1
+
+    for mismatch in mismatches:
+        log.warning(f"Member {mismatch['member_id']} has {mismatch['stored_count']} orders totalling "
+                    f"{mismatch['stored_total']} stored, expected {mismatch['expected_count']} totalling "
+                    f"{mismatch['expected_total']}")
+
+    if mismatches:
+        log.warning(f"Order aggregates of {len(mismatches)} members differ from orders. Run rebuild to fix them")
+        return 1
+
+    log.info("Order aggregates are consistent with orders")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain member order aggregates")
+    parser.add_argument("command", choices=("rebuild", "check"))
+    args = parser.parse_args()
+
+    common.pool.open()
+    if args.command == "rebuild":
+        return rebuild()
+    return check()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,6 +1,9 @@
 import json
 
 class PelBox:
+    __slots__ = ("id", "security_key", "user_security_key", "member_id", "host", "connected", "locked", "dismantle",
+                 "expanding_value", "door_open")
+
     def __init__(self, data):
         data_json = json.loads(data.decode("utf-8"))
 
@@ -17,20 +20,16 @@ class PelBox:
 
     @staticmethod
     def new(id, security_key, user_security_key, host, member_id, connected, locked, dismantle, expanding_value, door_open):
-        new_data = {
-            "id": id,
-            "security_key": security_key,
-            "user_security_key": user_security_key, 
-            "member_id": member_id,
-            "host": host,
-            "connected": connected,
-            "locked": locked,
-            "dismantle": dismantle,
-            "expanding_value": expanding_value,
-            "door_open": door_open
-        }
+        return PelBox.from_row((id, security_key, user_security_key, host, member_id, connected, locked, dismantle, expanding_value, door_open))
 
-        pelbox = PelBox(json.dumps(new_data).encode("utf-8"))
+    @classmethod
+    def from_row(cls, row):
+        """
+            Build box straight from a get_pelbox_settings row without going through JSON.
+        """
+        pelbox = cls.__new__(cls)
+        (pelbox.id, pelbox.security_key, pelbox.user_security_key, pelbox.host, pelbox.member_id, pelbox.connected,
+         pelbox.locked, pelbox.dismantle, pelbox.expanding_value, pelbox.door_open) = row
         return pelbox
 
     def json_data(self):
@@ -0,0 +1,119 @@
+import json
+import logging
+
+from functools import wraps
+
+from flask import g, request
+
+from rpi import common
+from rpi import responses
+from rpi.member import Member
+from rpi.pelbox_member import PelBox
+from rpi.controller import ControllerError
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+class ContextError(Exception):
+    pass
+
+class MemberContext:
+    __slots__ = ("data", "access_token", "claims", "username", "member", "member_id", "pelbox")
+
+    def __init__(self, data, access_token, claims):
+        """
+            Parsed request data and authenticated member of the current request.
+
+            Member and box are loaded on first use and kept, so a handler and the pipeline never load them twice.
+        """
+        self.data = data
+        self.access_token = access_token
+        self.claims = claims
+        self.username = claims["preferred_username"]
+        self.member = None
+        self.member_id = None
+        self.pelbox = None
+
+    def load_member(self):
+        if self.member is None:
+            member_details = common.get_member_details(self.username)
+            if member_details is None:
+                raise ContextError(f"Member {self.username} could not be loaded")
+            self.member = Member.from_row(member_details)
+            self.member_id = self.member.id
+        return self.member
+
+    def load_device(self):
+        if self.pelbox is None:
+            device_context = common.get_device_context(self.username)
+            if device_context is None:
+                raise ContextError(f"Box of member {self.username} could not be loaded")
+            self.member_id = device_context[0]
+            self.pelbox = PelBox.from_row(device_context[1:])
+        return self.pelbox
+
+def request_data(source):
+    """
+        Returns (data, access token) of the current request. Body data has empty strings replaced with None.
+    """
+    if source == "body":
+        data_json = json.loads(request.data.decode("utf-8"))
+        data_json = {key: None if data_json[key] == "" else data_json[key] for key in data_json}
+        return data_json, data_json["access_token"]
+
+    access_token = request.headers.get("Access-Token")
+    if not access_token:
+        raise KeyError("Access-Token")
+    return None, access_token
+
+class MemberPipeline:
+    def __init__(self, keycloak):
+        """
+            Shared steps of member routes: parse request, authenticate member, load member or box and map errors
+            to responses.
+        """
+        self.keycloak = keycloak
+
+    def route(self, source="body", load=None):
+        """
+            Decorator passing MemberContext to the route as its first argument.
+
+            Args:
+                source: body to read JSON body with access_token, headers to read the Access-Token header
+                load: member or device to load Member or PelBox before the route runs, None to leave it to the route
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                try:
+                    data, access_token = request_data(source)
+
+                    claims, logged_in, status_code = self.keycloak.member_session(access_token)
+                    if status_code == 200 and not logged_in:
+                        return responses.static_response("not_logged_in")
+                    elif status_code != 200:
+                        return responses.static_response("something_went_wrong")
+
+                    context = g.member_context = MemberContext(data, access_token, claims)
+                    if load == "member":
+                        context.load_member()
+                    elif load == "device":
+                        context.load_device()
+
+                    return func(context, *args, **kwargs)
+                except ContextError as e:
+                    log.critical(e)
+                    return responses.static_response("something_went_wrong")
+                except ControllerError as e:
+                    log.critical(e)
+                    return responses.static_response("controller_unavailable")
+                except KeyError as e:
+                    log.critical(e)
+                    return responses.static_response("missing_arguments")
+                except json.decoder.JSONDecodeError as e:
+                    log.critical(e)
+                    return responses.static_response("bad_json")
+            return wrapper
+        return decorator
@@ -0,0 +1,140 @@
+"""
+    JSON responses of the management blueprint without going through jsonify.
+
+    Bodies are encoded with orjson when it is installed and JSON_ENCODER allows it, otherwise with the standard
+    json module. Fixed error bodies are encoded once on import. Without orjson box state is written straight from
+    PelBox attributes.
+"""
+import json
+import decimal
+import datetime
+import logging
+
+from environs import Env
+from flask import Response
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+env = Env()
+env.read_env()
+
+HEADERS = {"ContentType": "application/json"}
+
+def default(value):
+    """
+        Encode values the JSON encoders don't know. Decimal becomes its exact text as a JSON string, a float would
+        lose precision and the json module can't write it as a number without one, dates become ISO 8601 strings.
+    """
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def load_encoder(name="auto"):
+    """
+        Returns (encoder name, function encoding data to JSON bytes). name is orjson, json or auto for orjson when
+        installed.
+    """
+    if name in ("auto", "orjson"):
+        try:
+            import orjson
+
+            log.info("Encoding JSON responses with orjson")
+            return "orjson", lambda data: orjson.dumps(data, default=default)
+        except ImportError:
+            if name == "orjson":
+                raise
+
+    if name not in ("auto", "orjson", "json"):
+        raise ValueError(f"Unknown JSON encoder {name}")
+
+    encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=default)
+    return "json", lambda data: encoder.encode(data).encode("utf-8")
+
+encoder_name, dumps = load_encoder(env.str("JSON_ENCODER", "auto"))
+
+STATIC_BODIES = {
+    "missing_arguments": (400, {"success": False, "error": "Missing arguments"}),
+    "bad_json": (400, {"success": False, "error": "JSON is badly formatted"}),
+    "expanding_out_of_range": (400, {"success": False, "error": "Expanding value out of range"}),
+    "not_logged_in": (401, {"success": False, "message": "Member is not logged in"}),
+    "forbidden": (403, {"success": False, "message": "Forbidden"}),
+    "job_not_found": (404, {"success": False, "message": "Job not found"}),
+    "something_went_wrong": (500, {"success": False, "message": "Something went wrong"}),
+    "controller_unavailable": (503, {"success": False, "message": "Hardware controller is not available"}),
+    "too_many_streams": (503, {"success": False, "message": "Too many open state streams"}),
+    "success": (200, {"success": True})
+}
+
+STATIC_RESPONSES = {name: (status, dumps(body)) for name, (status, body) in STATIC_BODIES.items()}
+
+def static_response(name):
+    """
+        Response with one of the fixed bodies, encoded only once.
+    """
+    status, body = STATIC_RESPONSES[name]
+    return Response(body, status=status, headers=HEADERS, mimetype="application/json")
+
+def json_response(data, status=200):
+    return Response(dumps(data), status=status, headers=HEADERS, mimetype="application/json")
+
+LITERALS = {True: "true", False: "false", None: "null"}
+
+def scalar(value):
+    if value is None or value is True or value is False:
+        return LITERALS[value]
+    if type(value) is int:
+        return str(value)
+    # Keys and hosts are plain printable ASCII, only strings that need escaping go through the encoder
+    if type(value) is str and value.isascii() and value.isprintable() and '"' not in value and "\\" not in value:
+        return f'"{value}"'
+    return dumps(value).decode("utf-8")
+
+def pelbox_json(pelbox):
+    """
+        PelBox state as JSON text with the keys of PelBox.json_data, written straight from its attributes.
+    """
+    return (f'{{"id":{scalar(pelbox.id)},'
+            f'"security_key":{scalar(pelbox.security_key)},'
+            f'"user_security_key":{scalar(pelbox.user_security_key)},'
+            f'"host":{scalar(pelbox.host)},'
+            f'"member_id":{scalar(pelbox.member_id)},'
+            f'"connected":{scalar(pelbox.connected)},'
+            f'"locked":{scalar(pelbox.locked)},'
+            f'"dismantle":{scalar(pelbox.dismantle)},'
+            f'"expanding_value":{scalar(pelbox.expanding_value)},'
+            f'"door_open":{scalar(pelbox.door_open)}}}')
+
+def box_state_response(success, pelbox):
+    """
+        Response of locking_state and dismantle_state.
+
+        orjson encodes the json_data dict faster than the text can be put together in Python, without it the
+        body is written directly from the PelBox attributes.
+    """
+    if encoder_name == "orjson":
+        body = dumps({"success": bool(success), "settings": pelbox.json_data()})
+    else:
+        body = f'{{"success":{LITERALS[bool(success)]},"settings":{pelbox_json(pelbox)}}}'.encode("utf-8")
+    return Response(body, status=200, headers=HEADERS, mimetype="application/json")
+
+def stream_json_array(items, chunk_size=8192):
+    """
+        Yield JSON array of items as byte chunks of about chunk_size, one item is encoded at a time so the whole
+        array is never held in memory.
+    """
+    chunk = bytearray(b"[")
+    separator = b""
+    for item in items:
+        chunk += separator
+        chunk += dumps(item)
+        separator = b","
+        if len(chunk) >= chunk_size:
+            yield bytes(chunk)
+            chunk = bytearray()
+    chunk += b"]"
+    yield bytes(chunk)
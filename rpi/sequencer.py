@@ -0,0 +1,85 @@
+import time
+import logging
+import threading
+
+from collections import defaultdict
+
+from rpi.metrics import registry
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+class Step:
+    def __init__(self, name, motor, action, after=()):
+        """
+            Single motor action within a sequence.
+
+            Step starts only after all steps named in after finished successfully.
+        """
+        self.name = name
+        self.motor = motor
+        self.action = action
+        self.after = tuple(after)
+
+        self.done = threading.Event()
+        self.error = None
+
+class Sequencer:
+    def __init__(self):
+        """
+            Runs steps as a dependency graph, steps without dependency between them run in parallel.
+
+            Each motor has its own lock, so two steps never drive the same motor at the same time even
+            when they belong to different sequences.
+        """
+        self.locks = defaultdict(threading.Lock)
+        self.locks_lock = threading.Lock()
+
+    def motor_lock(self, motor):
+        with self.locks_lock:
+            return self.locks[motor]
+
+    def run(self, steps):
+        """
+            Run steps and wait until all of them finish.
+
+            Steps may only depend on steps listed before them. If a step fails its dependents are skipped and
+            the first error is raised once every started step finished.
+        """
+        by_name = {}
+        for step in steps:
+            for name in step.after:
+                if name not in by_name:
+                    raise ValueError(f"Step {step.name} depends on unknown or later step {name}")
+            by_name[step.name] = step
+
+        threads = [threading.Thread(target=self.run_step, args=(step, by_name), name=f"step-{step.name}") for step in steps]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        for step in steps:
+            if step.error is not None:
+                raise step.error
+
+    def run_step(self, step, by_name):
+        try:
+            for name in step.after:
+                dependency = by_name[name]
+                dependency.done.wait()
+                if dependency.error is not None:
+                    step.error = RuntimeError(f"Step {step.name} skipped because step {name} failed")
+                    return
+
+            with self.motor_lock(step.motor):
+                started = time.perf_counter()
+                step.action()
+                registry.observe("pelbox_motor_move_seconds", time.perf_counter() - started, {"motor": step.motor})
+        except Exception as e:
+            log.critical(f"Step {step.name} failed: {e}")
+            step.error = e
+        finally:
+            step.done.set()
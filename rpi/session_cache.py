@@ -0,0 +1,103 @@
+import time
+import threading
+from collections import OrderedDict
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.cacheable = True
+
+class SessionCache:
+    def __init__(self, ttl=5, negative_ttl=1, max_size=1024):
+        """
+            Bounded LRU cache of member session checks.
+
+            Entries are keyed by (sub, jti) of the member access token. Logged in results live for ttl seconds,
+            not logged in results for negative_ttl seconds and errors are not cached. Concurrent misses for
+            the same key wait for the single request already in flight instead of sending their own.
+        """
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_size = max_size
+
+        self.entries = OrderedDict()
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, load):
+        """
+            Returns cached (logged_in, status_code) for the key or calls load to get it.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            flight = self.in_flight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = Flight()
+                self.in_flight[key] = flight
+                leader = True
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = load()
+            if flight.cacheable:
+                self.store(key, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+            flight.done.set()
+
+    def store(self, key, result):
+        logged_in, status_code = result
+        if status_code != 200:
+            return
+
+        ttl = self.ttl if logged_in else self.negative_ttl
+        with self.lock:
+            self.entries[key] = (result, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, subject):
+        """
+            Drop all cached entries of the member with given token subject.
+        """
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == subject]:
+                del self.entries[key]
+            for key, flight in self.in_flight.items():
+                if key[0] == subject:
+                    flight.cacheable = False
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "size": len(self.entries)
+            }
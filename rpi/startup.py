@@ -0,0 +1,105 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from rpi.metrics import registry
+
+logging.basicConfig()
+log = logging.getLogger()
+logging.root.setLevel(logging.NOTSET)
+logging.basicConfig(level=logging.NOTSET)
+
+class StartupTask:
+    def __init__(self, name, func, required=True):
+        self.name = name
+        self.func = func
+        self.required = required
+
+        self.state = "pending"
+        self.attempts = 0
+        self.seconds = None
+        self.error = None
+        self.first_attempt = threading.Event()
+
+    def json_data(self):
+        return {
+            "state": self.state,
+            "required": self.required,
+            "attempts": self.attempts,
+            "seconds": self.seconds,
+            "error": self.error
+        }
+
+class Startup:
+    def __init__(self, retry_interval=5):
+        """
+            Runs service initialisation tasks concurrently in background threads while the app already serves.
+
+            A task is a callable returning True once its service is usable, returning False or raising means it is
+            retried every retry_interval seconds. The service is ready when every required task succeeded. Timing of
+            each task is logged once all of them finished their first attempt.
+        """
+        self.retry_interval = retry_interval
+        self.tasks = OrderedDict()
+        self.phases = OrderedDict()
+        self.started_at = None
+
+    def add(self, name, func, required=True):
+        self.tasks[name] = StartupTask(name, func, required)
+
+    def mark(self, name, seconds):
+        """
+            Record a phase that already happened, like imports before the tasks were started.
+        """
+        self.phases[name] = seconds
+        registry.observe("pelbox_startup_seconds", seconds, {"task": name})
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        for task in self.tasks.values():
+            threading.Thread(target=self.run, args=(task,), name=f"startup-{task.name}", daemon=True).start()
+        threading.Thread(target=self.report, name="startup-report", daemon=True).start()
+
+    def run(self, task):
+        started = time.perf_counter()
+        while True:
+            task.attempts += 1
+            task.state = "running"
+            try:
+                succeeded = task.func()
+                task.error = None if succeeded else "Not available yet"
+            except Exception as e:
+                log.critical(f"Startup task {task.name} failed: {e}")
+                succeeded = False
+                task.error = str(e)
+
+            if succeeded:
+                task.state = "ready"
+                task.seconds = time.perf_counter() - started
+                registry.observe("pelbox_startup_seconds", task.seconds, {"task": task.name})
+                task.first_attempt.set()
+                return
+
+            task.state = "retrying"
+            task.first_attempt.set()
+            time.sleep(self.retry_interval)
+
+    def ready(self):
+        return all(task.state == "ready" for task in self.tasks.values() if task.required)
+
+    def status(self):
+        return {name: task.json_data() for name, task in self.tasks.items()}
+
+    def report(self):
+        for task in self.tasks.values():
+            task.first_attempt.wait()
+
+        parts = [f"{name} {seconds:.2f}s" for name, seconds in self.phases.items()]
+        for task in self.tasks.values():
+            if task.state == "ready":
+                parts.append(f"{task.name} {task.seconds:.2f}s")
+            else:
+                parts.append(f"{task.name} {task.state} ({task.error})")
+
+        log.info(f"Startup took {time.perf_counter() - self.started_at:.2f}s: {', '.join(parts)}")
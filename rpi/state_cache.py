@@ -0,0 +1,107 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+
+class BoxStateCache:
+    def __init__(self, listener, ttl=30, max_size=1024):
+        """
+            Box state per member with a version counter, kept current by box_state notifications.
+
+            Every notification for a member bumps its version and drops its cached state, a resync bumps versions
+            of all members. Cached state is only served while listener is connected, otherwise changes could be
+            missed, and entries live at most ttl seconds. Versions start again on every process start, so ETags
+            carry a per process nonce.
+        """
+        self.listener = listener
+        self.ttl = ttl
+        self.max_size = max_size
+        self.nonce = uuid.uuid4().hex[:8]
+
+        self.clock = 0
+        self.floor = 0
+        self.versions = {}
+        self.entries = OrderedDict()
+        self.members = OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def live(self):
+        return self.listener.listening
+
+    def version(self, member_id):
+        with self.lock:
+            return max(self.versions.get(member_id, 0), self.floor)
+
+    def etag(self, member_id, version):
+        return f"{self.nonce}-{member_id}-{version}"
+
+    def member_id(self, username):
+        with self.lock:
+            return self.members.get(username)
+
+    def remember_member(self, username, member_id):
+        with self.lock:
+            self.members[username] = member_id
+            self.members.move_to_end(username)
+            while len(self.members) > self.max_size:
+                self.members.popitem(last=False)
+
+    def get(self, member_id):
+        """
+            Returns (pelbox, version) of the member or None if not cached or cache can't be trusted right now.
+        """
+        if not self.live():
+            return None
+
+        with self.lock:
+            entry = self.entries.get(member_id)
+            if entry is None or entry[2] <= time.monotonic():
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(member_id)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def store(self, member_id, pelbox, version):
+        """
+            Cache state read from the database. version has to be taken before the read, state is dropped if
+            a notification arrived in between.
+        """
+        if not self.live():
+            return
+
+        with self.lock:
+            if version != max(self.versions.get(member_id, 0), self.floor):
+                return
+
+            self.entries[member_id] = (pelbox, version, time.monotonic() + self.ttl)
+            self.entries.move_to_end(member_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def on_event(self, member_id, changes):
+        """
+            BoxEventBus observer, member_id is None on resync.
+        """
+        with self.lock:
+            self.clock += 1
+            if member_id is None:
+                self.floor = self.clock
+                self.versions.clear()
+                self.entries.clear()
+            else:
+                self.versions[member_id] = self.clock
+                self.entries.pop(member_id, None)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.entries),
+                "live": self.live()
+            }
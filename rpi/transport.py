@@ -0,0 +1,35 @@
+import random
+import requests
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+
+class JitteredRetry(Retry):
+    def get_backoff_time(self):
+        """
+            Full jitter on top of exponential backoff so retries from several workers don't arrive together.
+        """
+        backoff = super().get_backoff_time()
+        if backoff <= 0:
+            return 0
+        return random.uniform(0, backoff)
+
+def new_session(pool_size=10, retries=2, backoff_factor=0.2):
+    """
+        Returns requests session with keep-alive connection pool.
+
+        Only idempotent requests are retried, on connection errors and on 502, 503 and 504 responses.
+    """
+    retry = JitteredRetry(total=retries,
+                          backoff_factor=backoff_factor,
+                          status_forcelist=(502, 503, 504),
+                          method_whitelist=IDEMPOTENT_METHODS,
+                          raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
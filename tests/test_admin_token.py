@@ -0,0 +1,109 @@
+import time
+import itertools
+import threading
+
+import jwt
+
+from rpi.admin_token import AdminTokenManager, token_expiry
+
+token_ids = itertools.count()
+
+def token(expires_in):
+    payload = {"exp": int(time.time() + expires_in), "jti": str(next(token_ids))}
+    return jwt.encode(payload, "secret", algorithm="HS256").decode("utf-8")
+
+class FakeKeycloak:
+    def __init__(self, access_expires_in=60, refresh_expires_in=600, fail_refresh=False):
+        self.access_expires_in = access_expires_in
+        self.refresh_expires_in = refresh_expires_in
+        self.fail_refresh = fail_refresh
+        self.logins = 0
+        self.refreshes = 0
+        self.renewed = threading.Event()
+        self.manager = None
+
+    def log_in(self):
+        self.logins += 1
+        self.manager.set_tokens(token(self.access_expires_in), token(self.refresh_expires_in))
+        self.renewed.set()
+        return True
+
+    def refresh(self):
+        self.refreshes += 1
+        if self.fail_refresh:
+            return False
+        self.manager.set_tokens(token(self.access_expires_in), token(self.refresh_expires_in))
+        self.renewed.set()
+        return True
+
+def new_manager(keycloak, refresh_margin=30, retry_interval=10):
+    keycloak.manager = AdminTokenManager(keycloak.log_in, keycloak.refresh, refresh_margin=refresh_margin, retry_interval=retry_interval)
+    return keycloak.manager
+
+def test_token_expiry_reads_exp_claim():
+    assert abs(token_expiry(token(60)) - (time.time() + 60)) < 2
+    assert token_expiry(None) is None
+    assert token_expiry("not-a-token") is None
+
+def test_renewal_is_scheduled_before_expiry():
+    keycloak = FakeKeycloak(access_expires_in=60)
+    manager = new_manager(keycloak, refresh_margin=30)
+    manager.set_tokens(token(60), token(600))
+
+    assert not manager.is_expired()
+    assert 29 <= manager.timer.interval <= 31
+    manager.timer.cancel()
+
+def test_background_renewal_uses_refresh_token():
+    keycloak = FakeKeycloak(access_expires_in=600)
+    manager = new_manager(keycloak, refresh_margin=30)
+    manager.set_tokens(token(30), token(600))
+
+    assert keycloak.renewed.wait(2)
+    assert (keycloak.refreshes, keycloak.logins) == (1, 0)
+    assert not manager.is_expired()
+    manager.timer.cancel()
+
+def test_expired_refresh_token_logs_in_again():
+    keycloak = FakeKeycloak(access_expires_in=600)
+    manager = new_manager(keycloak, refresh_margin=30)
+    manager.set_tokens(token(30), token(10))
+
+    assert keycloak.renewed.wait(2)
+    assert (keycloak.refreshes, keycloak.logins) == (0, 1)
+    manager.timer.cancel()
+
+def test_failed_renewal_is_retried():
+    keycloak = FakeKeycloak(fail_refresh=True)
+    manager = new_manager(keycloak, refresh_margin=30, retry_interval=0.05)
+    manager.set_tokens(token(30), token(600))
+
+    deadline = time.time() + 2
+    while keycloak.refreshes < 3 and time.time() < deadline:
+        time.sleep(0.01)
+
+    assert keycloak.refreshes >= 3
+    manager.timer.cancel()
+
+def test_rejected_token_logs_in_once():
+    keycloak = FakeKeycloak(access_expires_in=600)
+    manager = new_manager(keycloak)
+    manager.set_tokens(token(600), token(600))
+    rejected = manager.access_token
+
+    manager.reject(rejected)
+    manager.reject(rejected)
+
+    assert keycloak.logins == 1
+    assert manager.access_token != rejected
+    manager.timer.cancel()
+
+def test_ensure_valid_renews_missing_token():
+    keycloak = FakeKeycloak(access_expires_in=600)
+    manager = new_manager(keycloak)
+
+    manager.ensure_valid()
+
+    assert keycloak.logins == 1
+    assert not manager.is_expired()
+    manager.timer.cancel()
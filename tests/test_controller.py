@@ -0,0 +1,165 @@
+import os
+import socket
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+from rpi import controller as controller_module
+from rpi.controller import (ControllerClient, ControllerError, ControllerServer, HardwareController,
+                            MAX_FRAME_SIZE, FRAME_HEADER, recv_frame, send_frame)
+
+class FakeController:
+    def __init__(self):
+        self.calls = []
+
+    def handle(self, message):
+        self.calls.append(message)
+        if message["c"] == "fail":
+            return {"ok": False, "e": "relay refused"}
+        return {"ok": True, "r": message.get("a", {})}
+
+class FakeDaemon:
+    def __init__(self, socket_path, reply=True):
+        """
+            Single connection daemon that can be killed along with its client connections, as a restart does.
+        """
+        self.reply = reply
+        self.controller = FakeController()
+        self.connections = []
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(socket_path)
+        self.listener.listen()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def handle(self, conn):
+        try:
+            while True:
+                message = recv_frame(conn)
+                if message is None:
+                    return
+                reply = self.controller.handle(message)
+                if not self.reply:
+                    conn.shutdown(socket.SHUT_RDWR)
+                    return
+                send_frame(conn, reply)
+        except OSError:
+            return
+
+    def kill(self):
+        self.listener.close()
+        for conn in self.connections:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            conn.close()
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to about 100 bytes, pytest tmp_path can be longer
+    directory = tempfile.mkdtemp(prefix="pelbox-")
+    yield os.path.join(directory, "controller.sock")
+    shutil.rmtree(directory)
+
+def test_frame_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        send_frame(left, {"c": "expand", "a": {"member_id": 1, "expanding_value": 3}})
+        send_frame(left, {"c": "ping"})
+
+        assert recv_frame(right) == {"c": "expand", "a": {"member_id": 1, "expanding_value": 3}}
+        assert recv_frame(right) == {"c": "ping"}
+
+def test_oversized_frame_is_rejected():
+    left, right = socket.socketpair()
+    with left, right:
+        left.sendall(FRAME_HEADER.pack(MAX_FRAME_SIZE + 1))
+
+        with pytest.raises(ValueError):
+            recv_frame(right)
+
+def test_close_between_frames_returns_none():
+    left, right = socket.socketpair()
+    with right:
+        left.close()
+
+        assert recv_frame(right) is None
+
+def test_close_inside_frame_raises():
+    left, right = socket.socketpair()
+    with right:
+        left.sendall(FRAME_HEADER.pack(10) + b"{}")
+        left.close()
+
+        with pytest.raises(ConnectionError):
+            recv_frame(right)
+
+def test_client_calls_server(socket_path):
+    fake = FakeController()
+    server = ControllerServer(socket_path, fake)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = ControllerClient(socket_path, timeout=2)
+    try:
+        assert client.door(member_id=1, door_status="open") == {"member_id": 1, "door_status": "open"}
+        assert client.set_relay(True) == {"on": True}
+        with pytest.raises(ControllerError, match="relay refused"):
+            client.call("fail")
+        assert len(fake.calls) == 3
+    finally:
+        client.shutdown()
+        server.shutdown()
+        server.server_close()
+
+def test_unreachable_daemon_raises_controller_error(socket_path):
+    client = ControllerClient(socket_path, timeout=1)
+
+    with pytest.raises(ControllerError, match="not reachable"):
+        client.ping()
+
+def test_client_reconnects_after_daemon_restart(socket_path):
+    client = ControllerClient(socket_path, timeout=2)
+    daemon = FakeDaemon(socket_path)
+    assert client.ping() == {}
+
+    daemon.kill()
+    os.unlink(socket_path)
+    restarted = FakeDaemon(socket_path)
+    try:
+        assert client.set_relay(False) == {"on": False}
+        assert [call["c"] for call in restarted.controller.calls] == ["set_relay"]
+    finally:
+        client.shutdown()
+        restarted.kill()
+
+def test_sent_command_is_never_repeated(socket_path):
+    client = ControllerClient(socket_path, timeout=2)
+    daemon = FakeDaemon(socket_path, reply=False)
+    try:
+        with pytest.raises(ControllerError):
+            client.expand(member_id=1, expanding_value=2)
+
+        assert [call["c"] for call in daemon.controller.calls] == ["expand"]
+    finally:
+        client.shutdown()
+        daemon.kill()
+
+def test_hardware_controller_rejects_unknown_command(monkeypatch):
+    monkeypatch.setattr(controller_module.registry, "register_callback", lambda callback: None)
+    hardware_controller = HardwareController(new_gpio=None)
+
+    assert hardware_controller.handle({"c": "shutdown"}) == {"ok": False, "e": "Unknown command shutdown"}
+    assert hardware_controller.handle({"c": "ping"}) == {"ok": True, "r": True}
+    assert hardware_controller.handle({"c": "set_relay", "a": {"on": True}}) == {"ok": False, "e": "Hardware is still starting"}
+    hardware_controller.shutdown(timeout=1)
@@ -0,0 +1,132 @@
+import psycopg2
+import psycopg2.extensions
+import pytest
+
+from rpi.db import ConnectionPool, PoolTimeout
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.executed.append(query)
+        self.conn.status = psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+
+    def close(self):
+        pass
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+        self.executed = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, name=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def poll(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = ConnectionPool(minconn=1, maxconn=2, timeout=0.05)
+    pool.connections = []
+
+    def connect():
+        conn = FakeConnection()
+        pool.connections.append(conn)
+        return conn
+
+    monkeypatch.setattr(pool, "connect", connect)
+    return pool
+
+def test_transaction_commits_and_returns_connection(pool):
+    with pool.transaction() as cur:
+        cur.execute("SELECT 1")
+
+    conn, = pool.connections
+    assert conn.commits == 1
+    assert pool.stats() == {"size": 1, "idle": 1}
+
+def test_transaction_rolls_back_when_block_raises(pool):
+    with pytest.raises(ValueError):
+        with pool.transaction() as cur:
+            cur.execute("UPDATE box_locking SET locked = true")
+            raise ValueError("failed")
+
+    conn, = pool.connections
+    assert conn.commits == 0
+    assert conn.rollbacks == 1
+    assert pool.stats() == {"size": 1, "idle": 1}
+
+def test_connection_is_reused(pool):
+    for _ in range(3):
+        with pool.transaction() as cur:
+            cur.execute("SELECT 1")
+
+    assert len(pool.connections) == 1
+
+def test_putconn_rolls_back_open_transaction(pool):
+    conn = pool.getconn()
+    conn.cursor().execute("SELECT 1")
+
+    pool.putconn(conn)
+
+    assert conn.rollbacks == 1
+    assert conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    assert pool.stats() == {"size": 1, "idle": 1}
+
+def test_putconn_discards_connection_that_fails_rollback(pool):
+    conn = pool.getconn()
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+
+    def broken_rollback():
+        raise psycopg2.InterfaceError("connection already closed")
+
+    conn.rollback = broken_rollback
+    pool.putconn(conn)
+
+    assert conn.closed
+    assert pool.stats() == {"size": 0, "idle": 0}
+
+def test_connection_error_discards_connections(pool):
+    with pytest.raises(psycopg2.OperationalError):
+        with pool.transaction():
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    conn, = pool.connections
+    assert conn.closed
+    assert pool.stats() == {"size": 0, "idle": 0}
+
+def test_getconn_times_out_when_pool_is_exhausted(pool):
+    first = pool.getconn()
+    second = pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    pool.putconn(first)
+    pool.putconn(second)
+    assert pool.stats() == {"size": 2, "idle": 2}
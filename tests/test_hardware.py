@@ -0,0 +1,114 @@
+"""
+    Motor timing on the simulated GPIO backend, so changes to motion planning that slow moves down fail in CI.
+"""
+import pytest
+
+from rpi import common
+from rpi.hardware import Motor, SimulatedGPIOBackend, VirtualClock
+from rpi.motion import MotionPlanner
+from rpi.controller import HardwareController
+
+SPEEDUP = 20
+# Virtual seconds of slack for thread scheduling, 1 virtual second is 50 ms of real time
+TOLERANCE = 1
+
+def new_planner(parallel_stages=False):
+    gpio = SimulatedGPIOBackend(VirtualClock(SPEEDUP))
+    motors = {"motor1": Motor(gpio, 13, 6), "motor2": Motor(gpio, 17, 27)}
+    return gpio, MotionPlanner(motors, parallel_stages=parallel_stages)
+
+def runs(gpio, pin):
+    """
+        Returns (start, stop) virtual times of the motor driven through PWM pin.
+    """
+    changes = [(time, value) for time, changed_pin, kind, value in gpio.transitions if changed_pin == pin and kind == "pwm"]
+    starts = [time for time, value in changes if value > 0]
+    stops = [time for time, value in changes if value == 0 and time > starts[0]]
+    return starts[0], stops[0]
+
+def runs_of_door(gpio):
+    return [transition for transition in gpio.transitions if transition[1] in (23, 24) and transition[2] == "pwm" and transition[3] > 0]
+
+def test_virtual_clock_runs_faster_than_real_time():
+    clock = VirtualClock(SPEEDUP)
+    clock.sleep(1)
+    assert 1 <= clock.now() < 1 + TOLERANCE
+
+def test_sequential_stages_move_one_after_another():
+    gpio, planner = new_planner()
+    planner.sync(0)
+    gpio.reset()
+
+    planner.move_to(5)
+
+    motor1_start, motor1_stop = runs(gpio, 6)
+    motor2_start, motor2_stop = runs(gpio, 27)
+    assert abs((motor1_stop - motor1_start) - 5) < TOLERANCE
+    assert abs((motor2_stop - motor2_start) - 3) < TOLERANCE
+    assert motor2_start >= motor1_stop
+    assert motor2_stop - motor1_start < 8 + TOLERANCE
+    assert planner.positions == {"motor1": 5.0, "motor2": 3.0}
+
+def test_parallel_stages_overlap():
+    gpio, planner = new_planner(parallel_stages=True)
+    planner.sync(0)
+    gpio.reset()
+    started = gpio.clock.now()
+
+    planner.move_to(5)
+
+    assert gpio.clock.now() - started < 5 + TOLERANCE
+
+def test_move_between_values_runs_only_the_difference():
+    gpio, planner = new_planner()
+    planner.sync(2)
+    gpio.reset()
+
+    planner.move_to(4)
+
+    start, stop = runs(gpio, 6)
+    assert abs((stop - start) - 2) < TOLERANCE
+    assert not [transition for transition in gpio.transitions if transition[1] in (17, 27)]
+
+def test_door_job_uses_state_read_when_it_runs(monkeypatch):
+    state = {"door_open": False, "expanding_value": 0}
+    monkeypatch.setattr(common, "get_pelbox_settings",
+                        lambda member_id: (1, "key", "user-key", "host", member_id, True, False, False, state["expanding_value"], state["door_open"]))
+    monkeypatch.setattr(common, "update_box_state", lambda member_id, changes, security_key=None: state.update(changes))
+
+    controller = HardwareController(lambda: SimulatedGPIOBackend(VirtualClock(SPEEDUP)))
+    controller.start()
+    opened = controller.door(1, "open")
+    closed = controller.door(1, "close")
+    controller.shutdown(timeout=5)
+
+    assert controller.actuator.get(opened["id"]).status == "done"
+    assert controller.actuator.get(closed["id"]).status == "done"
+    assert state["door_open"] is False
+    assert len(runs_of_door(controller.gpio)) == 2
+
+def test_jobs_fail_when_hardware_does_not_start():
+    controller = HardwareController(lambda: SimulatedGPIOBackend(), start_timeout=0.05)
+    job = controller.door(1, "open")
+    controller.shutdown(timeout=5)
+
+    assert controller.actuator.get(job["id"]).status == "failed"
+
+@pytest.mark.parametrize("persisted", [7, None])
+def test_unknown_persisted_value_homes_before_moving(persisted):
+    gpio, planner = new_planner()
+    planner.sync(persisted)
+
+    # Homing retracts each motor for its full calibrated range plus the homing margin
+    retract1_start, retract1_stop = runs(gpio, 13)
+    retract2_start, retract2_stop = runs(gpio, 17)
+    assert abs((retract1_stop - retract1_start) - 6) < TOLERANCE
+    assert abs((retract2_stop - retract2_start) - 4) < TOLERANCE
+    assert planner.positions == {"motor1": 0.0, "motor2": 0.0}
+
+    gpio.reset()
+    planner.move_to(2)
+
+    start, stop = runs(gpio, 6)
+    assert abs((stop - start) - 2) < TOLERANCE
+    assert planner.positions == {"motor1": 2.0, "motor2": 0.0}
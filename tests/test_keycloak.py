@@ -0,0 +1,69 @@
+import time
+
+import jwt
+import pytest
+import requests
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from rpi.jwks import JWKSCache
+from rpi.keycloak import Keycloak
+from rpi.session_cache import SessionCache
+
+ISSUER = "http://keycloak.test/auth/realms/pelbox"
+
+def new_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+
+SIGNING_KEY = new_key()
+OTHER_KEY = new_key()
+
+def token(key, kid="realm-key", **claims):
+    payload = {"sub": "member-1", "preferred_username": "alice", "iss": ISSUER, "aud": "account", "exp": int(time.time()) + 60}
+    payload.update(claims)
+    return jwt.encode(payload, key, algorithm="RS256", headers={"kid": kid}).decode("utf-8")
+
+class FailingHttp:
+    def __init__(self):
+        self.calls = 0
+
+    def get(self, url, timeout=None):
+        self.calls += 1
+        raise requests.exceptions.ConnectionError("Keycloak is down")
+
+@pytest.fixture
+def keycloak():
+    keycloak = Keycloak("admin-secret", "member-secret", "keycloak.test", local_verify=True, audience="account",
+                        issuer=ISSUER, http=FailingHttp(), session_cache=SessionCache())
+    keycloak.jwks.keys = {"realm-key": SIGNING_KEY.public_key()}
+    keycloak.jwks.last_refresh = time.monotonic()
+    return keycloak
+
+def test_valid_token_is_logged_in(keycloak):
+    claims, logged_in, status_code = keycloak.member_session(token(SIGNING_KEY))
+
+    assert (logged_in, status_code) == (True, 200)
+    assert claims["preferred_username"] == "alice"
+
+def test_token_signed_with_wrong_key_is_not_logged_in(keycloak):
+    assert keycloak.member_session(token(OTHER_KEY)) == (None, False, 200)
+
+def test_expired_token_is_not_logged_in(keycloak):
+    assert keycloak.member_session(token(SIGNING_KEY, exp=int(time.time()) - 60)) == (None, False, 200)
+
+def test_token_for_other_audience_is_not_logged_in(keycloak):
+    assert keycloak.member_session(token(SIGNING_KEY, aud="other-client")) == (None, False, 200)
+
+def test_malformed_token_is_an_error(keycloak):
+    assert keycloak.member_session("not-a-token") == (None, False, 500)
+
+def test_unknown_kid_refresh_is_rate_limited_while_keycloak_is_down():
+    http = FailingHttp()
+    jwks = JWKSCache("http://keycloak.test/certs", http, timeout=1, min_refresh_interval=30)
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        jwks.get_key("unknown")
+    for _ in range(5):
+        assert jwks.get_key("unknown") is None
+
+    assert http.calls == 1
@@ -0,0 +1,47 @@
+import json
+
+import pytest
+from flask import Flask
+
+from rpi import common
+from rpi import management
+from rpi.member import Member
+from rpi.controller import ControllerError
+
+MEMBER_ROW = (42, "alice", "alice@pelbox.local", "Alice", "Doe", "F", "Croatia", "Zagreb", "Ilica 1", "10000",
+              "+385000000", "phone-token", None, None, None)
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(management.keycloak, "member_session", lambda access_token: ({"preferred_username": "alice"}, True, 200))
+    monkeypatch.setattr(common, "get_member_details", lambda username: MEMBER_ROW)
+    app = Flask(__name__)
+    app.register_blueprint(management.management)
+    return app.test_client()
+
+@pytest.fixture
+def writes(monkeypatch):
+    writes = []
+    monkeypatch.setattr(common, "update_box_state", lambda member_id, changes, security_key=None: writes.append((member_id, changes)))
+    return writes
+
+def test_dismantle_switches_relay_then_persists(client, writes, monkeypatch):
+    relay = []
+    monkeypatch.setattr(management.controller, "set_relay", lambda on: relay.append(on) or True)
+
+    response = client.put("/set_dismantle", data=json.dumps({"access_token": "token", "dismantle": True}))
+
+    assert response.status_code == 200
+    assert relay == [True]
+    assert writes == [(42, {"dismantle": True})]
+
+def test_dismantle_writes_nothing_when_relay_fails(client, writes, monkeypatch):
+    def set_relay(on):
+        raise ControllerError("Hardware is still starting")
+
+    monkeypatch.setattr(management.controller, "set_relay", set_relay)
+
+    response = client.put("/set_dismantle", data=json.dumps({"access_token": "token", "dismantle": True}))
+
+    assert response.status_code == 503
+    assert writes == []
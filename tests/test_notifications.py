@@ -0,0 +1,97 @@
+import json
+from contextlib import contextmanager
+
+import pytest
+from flask import Flask
+
+from rpi import common
+from rpi import management
+
+class RecordingCursor:
+    def __init__(self, rowcount=0):
+        self.rowcount = rowcount
+        self.executed = []
+
+    def execute(self, query, params=None):
+        self.executed.append((" ".join(query.split()), params))
+
+@pytest.fixture
+def cursor(monkeypatch):
+    cursor = RecordingCursor(rowcount=3)
+
+    @contextmanager
+    def transaction(name=None, itersize=None):
+        yield cursor
+
+    monkeypatch.setattr(common.pool, "transaction", transaction)
+    return cursor
+
+def test_mark_read_by_ids_is_one_statement_scoped_to_member(cursor):
+    assert common.mark_notifications_read("alice", ids=[4, 5, 6]) == 3
+
+    (query, params), = cursor.executed
+    assert query.startswith("UPDATE notifications n SET is_read = true FROM members m")
+    assert "m.id = n.member_id AND m.username = %s" in query
+    assert "n.id = ANY(%s)" in query
+    assert params == ("alice", [4, 5, 6])
+
+def test_mark_read_up_to_id_is_scoped_to_member(cursor):
+    common.mark_notifications_read("alice", up_to=42)
+
+    (query, params), = cursor.executed
+    assert "m.username = %s" in query
+    assert "n.id <= %s" in query
+    assert params == ("alice", 42)
+
+def test_mark_read_returns_none_on_database_error(monkeypatch):
+    @contextmanager
+    def transaction(name=None, itersize=None):
+        raise RuntimeError("database is down")
+        yield
+
+    monkeypatch.setattr(common.pool, "transaction", transaction)
+
+    assert common.mark_notifications_read("alice", ids=[1]) is None
+
+@pytest.mark.parametrize("ids, error", [
+    ([1, 2], None),
+    ([], "Ids have to be a non empty list"),
+    ("1,2", "Ids have to be a non empty list"),
+    ([1, "2"], "Ids have to be integers"),
+    ([1, True], "Ids have to be integers"),
+    ([[1]], "Ids have to be integers")
+])
+def test_notification_ids(ids, error):
+    parsed, message = management.notification_ids(ids)
+
+    assert message == error
+    assert parsed == (ids if error is None else None)
+
+def test_notification_ids_are_limited(monkeypatch):
+    monkeypatch.setenv("NOTIFICATIONS_MAX_MARK_READ", "2")
+
+    assert management.notification_ids([1, 2, 3]) == (None, "At most 2 ids are allowed")
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(management.keycloak, "member_session", lambda access_token: ({"preferred_username": "alice"}, True, 200))
+    app = Flask(__name__)
+    app.register_blueprint(management.management)
+    return app.test_client()
+
+def test_route_marks_read_for_token_member_only(client, monkeypatch):
+    calls = []
+    monkeypatch.setattr(common, "mark_notifications_read", lambda username, ids=None, up_to=None: calls.append((username, ids, up_to)) or 2)
+
+    response = client.put("/notifications/read", data=json.dumps({"access_token": "token", "username": "bob", "ids": [7, 8]}))
+
+    assert response.status_code == 200
+    assert json.loads(response.get_data()) == {"success": True, "updated": 2}
+    assert calls == [("alice", [7, 8], None)]
+
+def test_route_rejects_invalid_ids(client, monkeypatch):
+    monkeypatch.setattr(common, "mark_notifications_read", lambda *args, **kwargs: pytest.fail("must not write"))
+
+    response = client.put("/notifications/read", data=json.dumps({"access_token": "token", "ids": ["all"]}))
+
+    assert response.status_code == 400
@@ -0,0 +1,123 @@
+import json
+
+import pytest
+from flask import Flask
+
+from rpi import common
+from rpi.controller import ControllerError
+from rpi.pipeline import ContextError, MemberPipeline
+
+MEMBER_ROW = (42, "alice", "alice@pelbox.local", "Alice", "Doe", "F", "Croatia", "Zagreb", "Ilica 1", "10000",
+              "+385000000", "phone-token", None, None, None)
+
+class FakeKeycloak:
+    def __init__(self):
+        self.session = ({"preferred_username": "alice"}, True, 200)
+        self.tokens = []
+
+    def member_session(self, access_token):
+        self.tokens.append(access_token)
+        return self.session
+
+@pytest.fixture
+def keycloak():
+    return FakeKeycloak()
+
+@pytest.fixture
+def seen():
+    return []
+
+@pytest.fixture
+def client(keycloak, seen):
+    pipeline = MemberPipeline(keycloak)
+    app = Flask(__name__)
+
+    @app.route("/body", methods=["PUT"])
+    @pipeline.route()
+    def body(context):
+        seen.append(context.data)
+        return {"value": context.data["value"]}
+
+    @app.route("/headers", methods=["GET"])
+    @pipeline.route(source="headers", load="member")
+    def headers(context):
+        seen.append(context.member.id)
+        return {"member_id": context.member_id}
+
+    @app.route("/raise/<kind>", methods=["GET"])
+    @pipeline.route(source="headers")
+    def fail(context, kind):
+        if kind == "context":
+            raise ContextError("Box could not be loaded")
+        raise ControllerError("Hardware controller is not reachable")
+
+    return app.test_client()
+
+def put(client, data):
+    return client.put("/body", data=json.dumps(data))
+
+def test_body_is_passed_with_empty_strings_as_none(client, keycloak, seen):
+    response = put(client, {"access_token": "token", "value": "", "other": "x"})
+
+    assert response.status_code == 200
+    assert seen == [{"access_token": "token", "value": None, "other": "x"}]
+    assert keycloak.tokens == ["token"]
+
+def test_member_is_loaded_from_header_token(client, keycloak, seen, monkeypatch):
+    monkeypatch.setattr(common, "get_member_details", lambda username: MEMBER_ROW)
+
+    response = client.get("/headers", headers={"Access-Token": "token"})
+
+    assert response.get_json() == {"member_id": 42}
+    assert seen == [42]
+    assert keycloak.tokens == ["token"]
+
+def test_not_logged_in_is_401(client, keycloak, seen):
+    keycloak.session = (None, False, 200)
+
+    response = put(client, {"access_token": "token", "value": 1})
+
+    assert response.status_code == 401
+    assert seen == []
+
+def test_keycloak_failure_is_500(client, keycloak, seen):
+    keycloak.session = (None, False, 503)
+
+    response = put(client, {"access_token": "token", "value": 1})
+
+    assert response.status_code == 500
+    assert seen == []
+
+def test_member_that_cannot_be_loaded_is_500(client, seen, monkeypatch):
+    monkeypatch.setattr(common, "get_member_details", lambda username: None)
+
+    response = client.get("/headers", headers={"Access-Token": "token"})
+
+    assert response.status_code == 500
+    assert seen == []
+
+@pytest.mark.parametrize("kind, status", [("context", 500), ("controller", 503)])
+def test_route_errors_are_mapped(client, kind, status):
+    response = client.get(f"/raise/{kind}", headers={"Access-Token": "token"})
+
+    assert response.status_code == status
+
+def test_missing_body_argument_is_400(client, keycloak):
+    response = put(client, {"value": 1})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Missing arguments"
+    assert keycloak.tokens == []
+
+def test_missing_access_token_header_is_400(client, keycloak):
+    response = client.get("/headers")
+
+    assert response.status_code == 400
+    assert keycloak.tokens == []
+
+def test_bad_json_is_400(client, keycloak):
+    response = client.put("/body", data="{not json")
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "JSON is badly formatted"
+    assert keycloak.tokens == []
@@ -0,0 +1,85 @@
+import time
+import threading
+
+import pytest
+
+from rpi.sequencer import Sequencer, Step
+
+class Recorder:
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def action(self, name, duration=0.05):
+        def run():
+            with self.lock:
+                self.events.append(("start", name, time.monotonic()))
+            time.sleep(duration)
+            with self.lock:
+                self.events.append(("end", name, time.monotonic()))
+        return run
+
+    def time(self, kind, name):
+        return next(at for event, step, at in self.events if event == kind and step == name)
+
+def test_dependent_step_starts_after_its_dependency():
+    recorder = Recorder()
+    Sequencer().run([
+        Step("open", "door", recorder.action("open")),
+        Step("expand", "motor1", recorder.action("expand"), after=("open",))
+    ])
+
+    assert recorder.time("start", "expand") >= recorder.time("end", "open")
+
+def test_independent_steps_run_in_parallel():
+    recorder = Recorder()
+    started = time.monotonic()
+    Sequencer().run([
+        Step("motor1", "motor1", recorder.action("motor1", 0.2)),
+        Step("motor2", "motor2", recorder.action("motor2", 0.2))
+    ])
+
+    assert time.monotonic() - started < 0.35
+    assert recorder.time("start", "motor2") < recorder.time("end", "motor1")
+
+def test_steps_on_same_motor_never_overlap():
+    recorder = Recorder()
+    sequencer = Sequencer()
+    sequences = [
+        threading.Thread(target=sequencer.run, args=([Step(name, "motor1", recorder.action(name))],))
+        for name in ("first", "second")
+    ]
+    for sequence in sequences:
+        sequence.start()
+    for sequence in sequences:
+        sequence.join()
+
+    first, second = sorted(("first", "second"), key=lambda name: recorder.time("start", name))
+    assert recorder.time("start", second) >= recorder.time("end", first)
+
+def test_failed_step_skips_dependents_and_raises_its_error():
+    recorder = Recorder()
+
+    def fail():
+        raise OSError("motor stalled")
+
+    with pytest.raises(OSError, match="motor stalled"):
+        Sequencer().run([
+            Step("expand", "motor1", fail),
+            Step("close", "door", recorder.action("close"), after=("expand",)),
+            Step("other", "motor2", recorder.action("other"))
+        ])
+
+    assert [name for event, name, at in recorder.events if event == "start"] == ["other"]
+
+@pytest.mark.parametrize("after", [("missing",), ("later",)])
+def test_unknown_or_later_dependency_is_rejected(after):
+    recorder = Recorder()
+
+    with pytest.raises(ValueError):
+        Sequencer().run([
+            Step("first", "motor1", recorder.action("first"), after=after),
+            Step("later", "motor2", recorder.action("later"))
+        ])
+
+    assert recorder.events == []
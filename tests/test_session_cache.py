@@ -0,0 +1,112 @@
+import time
+import threading
+
+import pytest
+
+from rpi.session_cache import SessionCache
+
+def test_logged_in_result_is_cached_for_ttl():
+    cache = SessionCache(ttl=0.1, negative_ttl=0.1)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return True, 200
+
+    assert cache.get(("sub", "jti"), load) == (True, 200)
+    assert cache.get(("sub", "jti"), load) == (True, 200)
+    assert len(calls) == 1
+
+    time.sleep(0.15)
+    cache.get(("sub", "jti"), load)
+    assert len(calls) == 2
+    assert cache.stats()["hits"] == 1
+
+def test_not_logged_in_uses_negative_ttl():
+    cache = SessionCache(ttl=60, negative_ttl=0.05)
+    cache.get(("sub", "jti"), lambda: (False, 200))
+
+    time.sleep(0.1)
+    assert cache.get(("sub", "jti"), lambda: (True, 200)) == (True, 200)
+
+def test_errors_are_not_cached():
+    cache = SessionCache()
+    cache.get(("sub", "jti"), lambda: (False, 500))
+
+    assert cache.get(("sub", "jti"), lambda: (True, 200)) == (True, 200)
+    assert cache.stats()["misses"] == 2
+
+def test_concurrent_misses_share_one_load():
+    cache = SessionCache()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def load():
+        calls.append(1)
+        release.wait(1)
+        return True, 200
+
+    threads = [threading.Thread(target=lambda: results.append(cache.get(("sub", "jti"), load))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [(True, 200)] * 5
+
+def test_waiters_get_the_leader_error():
+    cache = SessionCache()
+    release = threading.Event()
+    errors = []
+
+    def load():
+        release.wait(1)
+        raise RuntimeError("Keycloak is down")
+
+    def get():
+        try:
+            cache.get(("sub", "jti"), load)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=get) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    while cache.stats()["coalesced"] < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert errors == ["Keycloak is down"] * 3
+    assert cache.stats()["size"] == 0
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SessionCache(max_size=2)
+    for key in ("a", "b"):
+        cache.get((key, "jti"), lambda: (True, 200))
+    cache.get(("a", "jti"), lambda: pytest.fail("cached"))
+    cache.get(("c", "jti"), lambda: (True, 200))
+
+    assert cache.get(("a", "jti"), lambda: pytest.fail("cached")) == (True, 200)
+    assert cache.get(("b", "jti"), lambda: (False, 200)) == (False, 200)
+
+def test_invalidate_drops_member_entries_and_in_flight_result():
+    cache = SessionCache()
+    cache.get(("member", "jti-1"), lambda: (True, 200))
+    cache.get(("other", "jti-1"), lambda: (True, 200))
+
+    def load():
+        cache.invalidate("member")
+        return True, 200
+
+    cache.get(("member", "jti-2"), load)
+
+    assert cache.get(("member", "jti-1"), lambda: (False, 200)) == (False, 200)
+    assert cache.get(("member", "jti-2"), lambda: (False, 200)) == (False, 200)
+    assert cache.get(("other", "jti-1"), lambda: pytest.fail("cached")) == (True, 200)
@@ -0,0 +1,83 @@
+import pytest
+
+from rpi.state_cache import BoxStateCache
+
+class FakeListener:
+    def __init__(self, listening=True):
+        self.listening = listening
+
+@pytest.fixture
+def listener():
+    return FakeListener()
+
+@pytest.fixture
+def cache(listener):
+    return BoxStateCache(listener, ttl=30, max_size=2)
+
+def test_stored_state_is_served_with_its_version(cache):
+    version = cache.version(1)
+    cache.store(1, "pelbox", version)
+
+    assert cache.get(1) == ("pelbox", version)
+
+def test_event_bumps_version_and_changes_etag(cache):
+    version = cache.version(1)
+    etag = cache.etag(1, version)
+    cache.store(1, "pelbox", version)
+
+    cache.on_event(1, {"locked": True})
+
+    assert cache.version(1) > version
+    assert cache.etag(1, cache.version(1)) != etag
+    assert cache.get(1) is None
+
+def test_event_only_affects_its_member(cache):
+    cache.store(2, "other", cache.version(2))
+    version = cache.version(2)
+
+    cache.on_event(1, {"locked": True})
+
+    assert cache.version(2) == version
+    assert cache.get(2) == ("other", version)
+
+def test_state_read_before_event_is_not_stored(cache):
+    version = cache.version(1)
+    cache.on_event(1, {"door_open": True})
+
+    cache.store(1, "stale", version)
+
+    assert cache.get(1) is None
+
+def test_resync_bumps_every_version(cache):
+    versions = {member_id: cache.version(member_id) for member_id in (1, 2)}
+    cache.store(1, "pelbox", versions[1])
+
+    cache.on_event(None, "resync")
+
+    assert all(cache.version(member_id) > version for member_id, version in versions.items())
+    assert cache.get(1) is None
+
+def test_nothing_is_cached_while_listener_is_down(cache, listener):
+    listener.listening = False
+    cache.store(1, "pelbox", cache.version(1))
+    listener.listening = True
+
+    assert cache.get(1) is None
+
+def test_cached_state_is_not_served_while_listener_is_down(cache, listener):
+    cache.store(1, "pelbox", cache.version(1))
+    listener.listening = False
+
+    assert cache.get(1) is None
+
+def test_etags_differ_between_processes(listener):
+    first, second = BoxStateCache(listener), BoxStateCache(listener)
+
+    assert first.etag(1, 0) != second.etag(1, 0)
+
+def test_least_recently_used_entry_is_evicted(cache):
+    for member_id in (1, 2, 3):
+        cache.store(member_id, f"pelbox-{member_id}", cache.version(member_id))
+
+    assert cache.get(1) is None
+    assert cache.get(3) is not None